@@ -1220,9 +1220,10 @@ with st.container():
                     
                     # Inference using logic similar to hybrid_cnn/test.py
                     # Preprocess
-                    residuals = process_batch_gpu([temp_path])
-                    if residuals:
-                        residuals = np.array(residuals, dtype=np.float32)
+                    batch = process_batch_gpu([temp_path])
+                    if len(batch):
+                        # (1, H, W) residuals, aligned with batch.paths
+                        residuals = batch.residuals
                         
                         # Extract Features
                         # cached model resources
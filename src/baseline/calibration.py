@@ -0,0 +1,73 @@
+"""
+calibration.py
+Probability calibration for the baseline SVM.
+
+SVC(probability=True) runs an internal 5-fold Platt CV at fit time. This
+wrapper fits the SVC once on most of the training data, then fits a
+multinomial logistic map from its decision_function scores to
+probabilities on a held-out calibration split. At inference that is one
+decision_function call plus a tiny (K x K) linear map.
+"""
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+
+
+CALIBRATION_SIZE = 0.2
+
+
+class CalibratedSVM:
+    """
+    SVC + separately fitted sigmoid / softmax calibration.
+    Exposes the sklearn classifier surface the baseline scripts use:
+    fit, predict, predict_proba, decision_function, classes_.
+    """
+
+    def __init__(self, svm, calibration_size=CALIBRATION_SIZE, random_state=42):
+        self.svm = svm
+        self.calibration_size = calibration_size
+        self.random_state = random_state
+        self.calibrator = None
+
+    def fit(self, X, y):
+        # Stratify unless some class is too small to appear on both sides
+        stratify = y if np.unique(y, return_counts=True)[1].min() >= 2 else None
+        X_fit, X_cal, y_fit, y_cal = train_test_split(
+            X, y, test_size=self.calibration_size, random_state=self.random_state, stratify=stratify
+        )
+        self.svm.fit(X_fit, y_fit)
+        self.calibrator = LogisticRegression(C=1e4, max_iter=1000)
+        self.calibrator.fit(self._scores(X_cal), y_cal)
+        self.classes_ = self.svm.classes_
+        return self
+
+    def _scores(self, X):
+        scores = self.svm.decision_function(X)
+        return scores.reshape(len(scores), -1)
+
+    def decision_function(self, X):
+        return self.svm.decision_function(X)
+
+    def predict_proba(self, X):
+        proba = self.calibrator.predict_proba(self._scores(X))
+        # Calibration split may lack a rare class: map columns back onto classes_
+        if len(self.calibrator.classes_) != len(self.classes_):
+            full = np.zeros((len(proba), len(self.classes_)))
+            full[:, np.searchsorted(self.classes_, self.calibrator.classes_)] = proba
+            proba = full
+        return proba
+
+    def predict(self, X):
+        # Consistent with predict_proba (as CalibratedClassifierCV does)
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    @property
+    def n_support_(self):
+        return self.svm.n_support_
+
+
+def support_vector_count(model):
+    """Total support vectors of an SVC or CalibratedSVM (None for other models)."""
+    n_support = getattr(model, "n_support_", None)
+    return int(np.sum(n_support)) if n_support is not None else None
@@ -0,0 +1,185 @@
+"""
+compact_model.py
+Compact, memory-mappable export of the baseline Random Forest.
+
+All trees are flattened into a handful of .npy arrays (global node ids):
+    left.npy       int32   left child; leaves store -(leaf_id + 1)
+    right.npy      int32   right child
+    feature.npy    int32   split feature
+    threshold.npy  float64 split threshold (X <= t goes left)
+    leaf_value.npy float32 (n_leaves, n_classes) normalised class fractions
+    roots.npy      int32   root node of every tree
+    meta.json      classes, n_features, max_depth, source joblib size / mtime, ...
+CompactForest opens them with mmap_mode="r", so loading is near-instant and
+every dashboard / worker process shares the same page-cache pages instead
+of unpickling its own copy. Predictions match RandomForestClassifier.
+"""
+
+import os
+import sys
+import json
+import time
+import joblib
+import numpy as np
+
+FORMAT_VERSION = 1
+ARRAYS = ("left", "right", "feature", "threshold", "leaf_value", "roots")
+
+
+def source_stamp(path):
+    """Size and mtime of the joblib a compact export was made from (None if missing)."""
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def export_forest(rf, out_dir, source_path=None):
+    """
+    Write a fitted RandomForestClassifier (single output) to out_dir.
+    source_path: the joblib rf was saved to; its stamp lets load_model detect a stale export.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    left, right, feature, threshold, leaf_value, roots = [], [], [], [], [], []
+    node_offset = leaf_offset = 0
+    max_depth = 0
+
+    for est in rf.estimators_:
+        t = est.tree_
+        is_leaf = t.children_left == -1
+        n_leaves = int(is_leaf.sum())
+        leaf_ids = np.cumsum(is_leaf) - 1 + leaf_offset
+
+        l = np.where(is_leaf, -(leaf_ids + 1), t.children_left + node_offset)
+        r = np.where(is_leaf, -1, t.children_right + node_offset)
+        left.append(l.astype(np.int32))
+        right.append(r.astype(np.int32))
+        feature.append(np.where(is_leaf, 0, t.feature).astype(np.int32))
+        threshold.append(t.threshold.astype(np.float64))
+
+        # Per-tree class fractions, normalised like DecisionTreeClassifier.predict_proba
+        value = t.value[is_leaf, 0, :].astype(np.float64)
+        value /= np.maximum(value.sum(axis=1, keepdims=True), np.finfo(np.float64).tiny)
+        leaf_value.append(value.astype(np.float32))
+
+        roots.append(node_offset)
+        node_offset += t.node_count
+        leaf_offset += n_leaves
+        max_depth = max(max_depth, int(t.max_depth))
+
+    arrays = {
+        "left": np.concatenate(left), "right": np.concatenate(right),
+        "feature": np.concatenate(feature), "threshold": np.concatenate(threshold),
+        "leaf_value": np.concatenate(leaf_value), "roots": np.asarray(roots, dtype=np.int32),
+    }
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), arr)
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "classes": rf.classes_.tolist(),
+        "n_features": int(rf.n_features_in_),
+        "n_trees": len(rf.estimators_),
+        "n_nodes": int(node_offset),
+        "max_depth": max_depth,
+        "source": source_stamp(source_path) if source_path else None,
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class CompactForest:
+    """Memory-mapped RandomForestClassifier replacement (predict / predict_proba)."""
+
+    def __init__(self, model_dir, mmap_mode="r"):
+        with open(os.path.join(model_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact model format in {model_dir}: {self.meta.get('format_version')}")
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(model_dir, f"{name}.npy"), mmap_mode=mmap_mode))
+        self.classes_ = np.asarray(self.meta["classes"])
+        self.n_features_in_ = self.meta["n_features"]
+
+    def apply(self, X):
+        """(N, n_trees) leaf ids reached by every sample in every tree."""
+        # Trees compare float32 features against float64 thresholds, as sklearn does
+        X = np.asarray(X, dtype=np.float32)
+        n = len(X)
+        node = np.broadcast_to(np.asarray(self.roots), (n, len(self.roots))).copy()
+        rows = np.broadcast_to(np.arange(n)[:, None], node.shape)
+
+        for _ in range(self.meta["max_depth"] + 1):
+            child = self.left[node]
+            internal = child >= 0
+            if not internal.any():
+                break
+            nd = node[internal]
+            go_left = X[rows[internal], self.feature[nd]] <= self.threshold[nd]
+            node[internal] = np.where(go_left, child[internal], self.right[nd])
+        return -self.left[node] - 1
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        return self.leaf_value[leaves].astype(np.float64).mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def compact_dir(model_path):
+    """models/baseline/random_forest.joblib -> models/baseline/random_forest_compact"""
+    return os.path.splitext(model_path)[0] + "_compact"
+
+
+def is_current(model_path):
+    """True if compact_dir(model_path) was exported from model_path as it is now (or model_path is gone)."""
+    meta_path = os.path.join(compact_dir(model_path), "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    if not os.path.exists(model_path):
+        return True
+    with open(meta_path) as f:
+        source = json.load(f).get("source")
+    return source == source_stamp(model_path)
+
+
+def load_model(model_path, prefer_compact=True):
+    """
+    CompactForest if an export of the current model_path exists next to it,
+    else joblib.load (e.g. after retraining or copying in a new joblib without exporting).
+    """
+    if prefer_compact and is_current(model_path):
+        return CompactForest(compact_dir(model_path))
+    return joblib.load(model_path)
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+if __name__ == "__main__":
+    # Export models/baseline/random_forest.joblib and check it against the original
+    SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    default_path = os.path.join(os.path.dirname(SRC_DIR), "models", "baseline", "random_forest.joblib")
+    rf_path = sys.argv[1] if len(sys.argv) > 1 else default_path
+
+    t0 = time.perf_counter()
+    rf = joblib.load(rf_path)
+    joblib_s = time.perf_counter() - t0
+
+    out_dir = compact_dir(rf_path)
+    meta = export_forest(rf, out_dir, rf_path)
+    t0 = time.perf_counter()
+    compact = CompactForest(out_dir)
+    compact_s = time.perf_counter() - t0
+
+    X = np.random.default_rng(0).normal(size=(256, meta["n_features"]))
+    max_diff = float(np.abs(compact.predict_proba(X) - rf.predict_proba(X)).max())
+    agree = float((compact.predict(X) == rf.predict(X)).mean())
+
+    print(f"Exported {meta['n_trees']} trees / {meta['n_nodes']} nodes to {out_dir}")
+    print(f"Size: joblib {os.path.getsize(rf_path) / 1e6:.2f} MB -> compact {dir_size(out_dir) / 1e6:.2f} MB")
+    print(f"Load: joblib {joblib_s * 1000:.1f} ms -> mmap {compact_s * 1000:.1f} ms")
+    print(f"Check on random inputs: max |dproba| = {max_diff:.2e}, label agreement = {agree:.3f}")
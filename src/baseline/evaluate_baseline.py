@@ -1,75 +1,194 @@
-
 import os
-import pandas as pd
+import sys
+import json
+import time
+import argparse
 import joblib
-from sklearn.metrics import classification_report, confusion_matrix
-import seaborn as sns
-import matplotlib.pyplot as plt
+import numpy as np
+from datetime import datetime
+from sklearn.metrics import classification_report, confusion_matrix, accuracy_score, f1_score
 
 
-# Paths
-CSV_PATH      = "processed_data/test_split.csv"
-MODEL_DIR     = "models/baseline"
-SCALER_PATH   = os.path.join(MODEL_DIR, "scaler.joblib")
-ENCODER_PATH  = os.path.join(MODEL_DIR, "label_encoder.joblib")
+# Make src/ importable when run as a script (python src/baseline/evaluate_baseline.py)
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
 
+from preprocessing import read_metadata, find_table, FEATURE_COLUMNS
+from baseline.compact_model import load_model
+from baseline.model_search import single_latency
+from baseline.predict_baseline import MODEL_FILES, SCALER_FILE, ENCODER_FILE
 
-def evaluate_model(model_path, name, save_dir="results"):
-    # 1) Load dataset
-    df = pd.read_csv(CSV_PATH)
+# Paths (the newer of test_split.parquet / .csv)
+DATA_PATH     = find_table("processed_data/test_split")
+MODEL_DIR     = "models/baseline"
+RESULTS_DIR   = "results/baseline_eval"
 
-    # Same feature selection as training
-    # Note: 'encoded_label' was added during training split saving, so we must drop it too.
-    drop_cols = ["file_name", "dataset_source", "main_class", "resolution", "class_label", "encoded_label"]
-    feature_cols = [c for c in df.columns if c not in drop_cols]
+# Registered models: key -> (display name, artifact file); add new baselines here
+EVAL_MODELS = {
+    "rf": ("Random Forest", MODEL_FILES["rf"]),
+    "svm": ("SVM", MODEL_FILES["svm"]),
+}
 
-    X = df[feature_cols]
-    y_str = df["class_label"]          # original string labels
+LATENCY_SAMPLES = 20
 
-    # 2) Load scaler, label encoder and model
-    scaler = joblib.load(SCALER_PATH)
-    le = joblib.load(ENCODER_PATH)
-    model = joblib.load(model_path)
 
+def load_test_set(data_path=DATA_PATH, model_dir=MODEL_DIR):
+    """Test features (scaled once), encoded labels and class names, shared by every model."""
+    df = read_metadata(data_path, columns=["class_label"] + FEATURE_COLUMNS)
+    scaler = joblib.load(os.path.join(model_dir, SCALER_FILE))
+    le = joblib.load(os.path.join(model_dir, ENCODER_FILE))
     # Encode y using SAME encoder as training
-    y_true = le.transform(y_str)
-
-    # 3) Transform features and predict
-    X_scaled = scaler.transform(X)
-    y_pred = model.predict(X_scaled)
-
-    # 4) Classification report (decode back to class names)
-    target_names = le.classes_
-    print(f"\n=== {name} Evaluation ===")
-    print(classification_report(y_true, y_pred, target_names=target_names))
-
-    # 5) Confusion matrix (in encoded space, but show class names)
-    cm = confusion_matrix(y_true, y_pred)
+    y_true = le.transform(df["class_label"])
+    X_scaled = scaler.transform(df[FEATURE_COLUMNS])
+    return X_scaled, y_true, le.classes_
+
+
+def time_model(model, X, y_true, n_classes):
+    """Batch throughput, single-image latency and the same per true class."""
+    t0 = time.perf_counter()
+    y_pred = model.predict(X)
+    batch_s = time.perf_counter() - t0
+
+    per_class = {}
+    for k in range(n_classes):
+        Xk = X[y_true == k]
+        if not len(Xk):
+            continue
+        t0 = time.perf_counter()
+        model.predict(Xk)
+        dt = time.perf_counter() - t0
+        per_class[k] = {
+            "images_per_s": len(Xk) / dt if dt > 0 else None,
+            "latency_ms": single_latency(model, Xk, LATENCY_SAMPLES) * 1000,
+        }
+
+    timing = {
+        "images_per_s": len(X) / batch_s if batch_s > 0 else None,
+        "batch_ms_per_image": batch_s / max(len(X), 1) * 1000,
+        "latency_ms": single_latency(model, X, LATENCY_SAMPLES) * 1000,
+    }
+    return y_pred, timing, per_class
+
+
+def save_confusion_matrix(cm, class_names, name, save_dir):
+    """CSV always; PNG heatmap when matplotlib/seaborn are available (never shown)."""
+    stem = os.path.join(save_dir, f"{name.replace(' ', '_')}_confusion_matrix")
+    with open(stem + ".csv", "w") as f:
+        f.write("true\\pred," + ",".join(map(str, class_names)) + "\n")
+        for cls, row in zip(class_names, cm):
+            f.write(f"{cls}," + ",".join(map(str, row)) + "\n")
+
+    try:
+        import matplotlib
+        matplotlib.use("Agg")  # headless: nightly runs have no display
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+    except ImportError:
+        return stem + ".csv"
 
     plt.figure(figsize=(8, 6))
     sns.heatmap(
         cm,
         annot=True,
         fmt="d",
-        xticklabels=target_names,
-        yticklabels=target_names,
+        xticklabels=class_names,
+        yticklabels=class_names,
         cmap="Blues"
     )
     plt.title(f"{name} Confusion Matrix")
     plt.xlabel("Predicted")
     plt.ylabel("True")
-
+    plt.savefig(stem + ".png", dpi=300, bbox_inches="tight")
+    plt.close()
+    return stem + ".png"
+
+
+def evaluate_all(model_keys=None, data_path=DATA_PATH, model_dir=MODEL_DIR, save_dir=RESULTS_DIR, plots=True,
+                 models=None):
+    """
+    Score every registered model against one load of the test set and
+    write metrics.json (+ confusion matrices) to save_dir.
+    models: {key: (display name, artifact file)} to use instead of EVAL_MODELS.
+    """
+    models = EVAL_MODELS if models is None else models
+    X, y_true, class_names = load_test_set(data_path, model_dir)
+    labels = np.arange(len(class_names))
     os.makedirs(save_dir, exist_ok=True)
-    save_path = os.path.join(save_dir, f"{name.replace(' ', '_')}_confusion_matrix.png")
-    plt.savefig(save_path, dpi=300, bbox_inches="tight")
-    print(f"Confusion matrix image saved to: {save_path}")
-
-    plt.show()
+    print(f"Test set: {len(X)} images, {len(class_names)} classes ({data_path})")
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "data_path": data_path,
+        "n_test": int(len(X)),
+        "classes": [str(c) for c in class_names],
+        "models": {},
+    }
+    for key in model_keys or list(models):
+        name, model_file = models[key]
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            print(f"Skipping {name}: {model_path} not found")
+            continue
+
+        t0 = time.perf_counter()
+        model = load_model(model_path)
+        load_s = time.perf_counter() - t0
+
+        y_pred, timing, per_class_timing = time_model(model, X, y_true, len(class_names))
+        cls_report = classification_report(
+            y_true, y_pred, labels=labels, target_names=class_names, output_dict=True, zero_division=0
+        )
+        cm = confusion_matrix(y_true, y_pred, labels=labels)
+
+        print(f"\n=== {name} Evaluation ===")
+        print(classification_report(y_true, y_pred, labels=labels, target_names=class_names, zero_division=0))
+        print(f"load {load_s * 1000:.1f} ms | {timing['images_per_s']:.0f} images/s | "
+              f"single {timing['latency_ms']:.2f} ms/image")
+
+        per_class = {}
+        for k, cls in enumerate(class_names):
+            per_class[str(cls)] = dict(cls_report[str(cls)], **per_class_timing.get(k, {}))
+
+        cm_path = save_confusion_matrix(cm, class_names, name, save_dir) if plots else None
+        report["models"][key] = {
+            "name": name,
+            "artifact": model_path,
+            "model_type": type(model).__name__,
+            "accuracy": float(accuracy_score(y_true, y_pred)),
+            "macro_f1": float(f1_score(y_true, y_pred, labels=labels, average="macro", zero_division=0)),
+            "load_ms": load_s * 1000,
+            **timing,
+            "per_class": per_class,
+            "confusion_matrix": cm.tolist(),
+            "confusion_matrix_file": cm_path,
+        }
+
+    metrics_path = os.path.join(save_dir, "metrics.json")
+    with open(metrics_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nMetrics saved to: {metrics_path}")
+    return report
+
+
+def evaluate_model(model_path, name, save_dir=RESULTS_DIR, data_path=DATA_PATH, plots=True):
+    # Single-model entry point kept for old callers; EVAL_MODELS is left untouched
+    key = name.lower().replace(" ", "_")
+    return evaluate_all([key], data_path, os.path.dirname(model_path) or ".", save_dir, plots,
+                        models={key: (name, os.path.basename(model_path))})
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Headless evaluation of every baseline model on the test split.")
+    p.add_argument("--models", nargs="+", choices=list(EVAL_MODELS), default=None,
+                   help="Models to evaluate (default: all registered).")
+    p.add_argument("--data", default=DATA_PATH, help="Test split table (.csv or .parquet).")
+    p.add_argument("--model-dir", default=MODEL_DIR)
+    p.add_argument("--output-dir", "-o", default=RESULTS_DIR, help="Where metrics.json and confusion matrices go.")
+    p.add_argument("--no-plots", action="store_true", help="Skip confusion matrix files.")
+    return p.parse_args()
 
 
 if __name__ == "__main__":
-    # Random Forest
-    evaluate_model(os.path.join(MODEL_DIR, "random_forest.joblib"), "Random Forest")
-
-    # SVM
-    evaluate_model(os.path.join(MODEL_DIR, "svm.joblib"), "SVM")
+    args = parse_args()
+    evaluate_all(args.models, args.data, args.model_dir, args.output_dir, plots=not args.no_plots)
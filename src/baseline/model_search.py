@@ -0,0 +1,171 @@
+"""
+model_search.py
+Hyperparameter search for the baseline RF / SVM models.
+- Stratified k-fold splits are built once and each fold's StandardScaler is
+  fitted once; every configuration reuses the cached scaled folds.
+- All (configuration, fold) fits run in parallel with joblib across cores.
+- Each configuration reports mean/std accuracy, wall-clock, fit time and
+  per-sample inference latency.
+"""
+
+import time
+import itertools
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.model_selection import StratifiedKFold
+from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.svm import SVC
+
+
+# Search spaces (grid over every combination)
+RF_GRID = {
+    "n_estimators": [100, 300],
+    "max_depth": [None, 20],
+    "min_samples_leaf": [1, 2],
+    "max_features": ["sqrt", 0.5],
+}
+SVM_GRID = {
+    "C": [0.3, 1.0, 3.0, 10.0, 30.0],
+    "gamma": ["scale", 0.03, 0.1, 0.3],
+}
+GRIDS = {"rf": RF_GRID, "svm": SVM_GRID}
+
+N_SPLITS = 5
+
+
+def make_model(name, params=None, n_jobs=1):
+    """Fresh estimator for a model name ("rf" / "svm") with the given hyperparameters."""
+    params = dict(params or {})
+    if name == "rf":
+        return RandomForestClassifier(random_state=42, n_jobs=n_jobs, **params)
+    if name == "svm":
+        params.setdefault("kernel", "rbf")
+        return SVC(random_state=42, **params)
+    raise ValueError(f"Unknown baseline model: {name}")
+
+
+def grid_configs(grid):
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def scaled_folds(X, y, n_splits=N_SPLITS, seed=42):
+    """
+    Stratified folds with scaling fitted on each training part, computed once.
+    Returns a list of (X_train_scaled, y_train, X_val_scaled, y_val).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed)
+    folds = []
+    for train_idx, val_idx in skf.split(X, y):
+        scaler = StandardScaler().fit(X[train_idx])
+        folds.append((scaler.transform(X[train_idx]), y[train_idx], scaler.transform(X[val_idx]), y[val_idx]))
+    return folds
+
+
+def time_predict(model, X_test):
+    """Predict, returning (predictions, per-sample predict seconds)."""
+    t0 = time.perf_counter()
+    y_pred = model.predict(X_test)
+    return y_pred, (time.perf_counter() - t0) / max(len(X_test), 1)
+
+
+def time_fit_predict(model, X_train, y_train, X_test):
+    """Fit + predict, returning (predictions, fit seconds, per-sample predict seconds)."""
+    t0 = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_s = time.perf_counter() - t0
+    y_pred, latency = time_predict(model, X_test)
+    return y_pred, fit_s, latency
+
+
+def for_serving(model):
+    """
+    Predict single-threaded (n_jobs=1, the sklearn default): on one-row calls
+    the thread fan-out of n_jobs=-1 costs more than the trees themselves.
+    """
+    if hasattr(model, "get_params") and "n_jobs" in model.get_params(deep=False):
+        model.set_params(n_jobs=1)
+    return model
+
+
+def single_latency(model, X, repeats=20, method="predict"):
+    """Median seconds for predicting one sample at a time (the dashboard / CLI case)."""
+    X = np.asarray(X)
+    fn = getattr(model, method)
+    times = []
+    for i in range(min(repeats, len(X))):
+        t0 = time.perf_counter()
+        fn(X[i:i + 1])
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times)) if times else 0.0
+
+
+def _score_fold(name, params, fold):
+    X_tr, y_tr, X_va, y_va = fold
+    y_pred, fit_s, latency = time_fit_predict(make_model(name, params), X_tr, y_tr, X_va)
+    return float(np.mean(y_pred == y_va)), fit_s, latency
+
+
+def search(X, y, models=("rf", "svm"), grids=GRIDS, n_splits=N_SPLITS, n_jobs=-1):
+    """
+    Cross-validate every configuration of every model.
+
+    Returns:
+        list of result dicts sorted by mean accuracy (best first): model,
+        params, cv_accuracy, cv_std, wall_s, fit_s, latency_ms
+    """
+    # Small classes cap the number of folds StratifiedKFold can make
+    min_class = int(np.bincount(np.unique(y, return_inverse=True)[1]).min())
+    n_splits = max(2, min(n_splits, min_class))
+    folds = scaled_folds(X, y, n_splits)
+
+    jobs = [(name, params) for name in models for params in grid_configs(grids[name])]
+    print(f"Searching {len(jobs)} configurations x {n_splits} folds (n_jobs={n_jobs})...")
+
+    t0 = time.perf_counter()
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(_score_fold)(name, params, fold) for name, params in jobs for fold in folds
+    )
+    print(f"Search finished in {time.perf_counter() - t0:.1f}s")
+
+    results = []
+    for j, (name, params) in enumerate(jobs):
+        fold_scores = scores[j * n_splits:(j + 1) * n_splits]
+        acc = np.array([s[0] for s in fold_scores])
+        fit_s = np.array([s[1] for s in fold_scores])
+        latency = np.array([s[2] for s in fold_scores])
+        results.append({
+            "model": name,
+            "params": params,
+            "cv_accuracy": float(acc.mean()),
+            "cv_std": float(acc.std()),
+            # Summed fit + predict time of this configuration over all folds
+            "wall_s": float(fit_s.sum() + (latency * [len(f[3]) for f in folds]).sum()),
+            "fit_s": float(fit_s.mean()),
+            "latency_ms": float(latency.mean() * 1000),
+        })
+    results.sort(key=lambda r: (-r["cv_accuracy"], r["wall_s"]))
+    return results
+
+
+def best_params(results, name):
+    """Hyperparameters of the best-scoring configuration of one model."""
+    for r in results:
+        if r["model"] == name:
+            return r["params"]
+    return {}
+
+
+def print_results(results, top=5):
+    """Table of the `top` configurations per model."""
+    print(f"{'model':<5} {'cv_acc':>7} {'std':>6} {'wall_s':>7} {'fit_s':>7} {'ms/img':>7}  params")
+    shown = {}
+    for r in results:
+        shown[r["model"]] = shown.get(r["model"], 0) + 1
+        if shown[r["model"]] > top:
+            continue
+        print(f"{r['model']:<5} {r['cv_accuracy']:7.4f} {r['cv_std']:6.3f} {r['wall_s']:7.2f} "
+              f"{r['fit_s']:7.3f} {r['latency_ms']:7.4f}  {r['params']}")
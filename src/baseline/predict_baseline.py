@@ -1,112 +1,276 @@
 import os
-import cv2
-import numpy as np
+import sys
+import csv
+import json
+import time
+import argparse
 import joblib
-from skimage.filters import sobel
-from scipy.stats import skew, kurtosis, entropy
+import numpy as np
 import pandas as pd
 
+# Make src/ importable when run as a script (python src/baseline/predict_baseline.py)
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
+
+from preprocessing import load_and_preprocess, metadata_feature_matrix, FEATURE_COLUMNS
+from preprocessing import iter_parallel, IMAGE_EXTS, DEFAULT_WORKERS, DEFAULT_CHUNKSIZE
+from baseline.compact_model import load_model
+
 # Paths
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PROJECT_ROOT = os.path.dirname(SRC_DIR)
 MODEL_DIR = os.path.join(PROJECT_ROOT, "models", "baseline")
-SCALER_PATH = os.path.join(MODEL_DIR, "scaler.joblib")
-ENCODER_PATH = os.path.join(MODEL_DIR, "label_encoder.joblib")
-RF_PATH = os.path.join(MODEL_DIR, "random_forest.joblib")
-SVM_PATH = os.path.join(MODEL_DIR, "svm.joblib")
-
-
-def load_and_preprocess(img_path, size=(512, 512)):
-    img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise ValueError(f"Could not load image: {img_path}")
-    img = img.astype(np.float32) / 255.0
-    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
-
-
-def compute_metadata_features(img, file_path):
-    h, w = img.shape
-    aspect_ratio = w / h
-    file_size_kb = os.path.getsize(file_path) / 1024.0
-
-    pixels = img.flatten()
-    mean_intensity = np.mean(pixels)
-    std_intensity = np.std(pixels)
-    skewness = skew(pixels)
-    kurt = kurtosis(pixels)
-    ent = entropy(np.histogram(pixels, bins=256, range=(0, 1))[0] + 1e-6)
-
-    edges = sobel(img)
-    edge_density = np.mean(edges > 0.1)
-
-    return {
-        "width": w,
-        "height": h,
-        "aspect_ratio": aspect_ratio,
-        "file_size_kb": file_size_kb,
-        "mean_intensity": mean_intensity,
-        "std_intensity": std_intensity,
-        "skewness": skewness,
-        "kurtosis": kurt,
-        "entropy": ent,
-        "edge_density": edge_density,
-    }
+SCALER_FILE = "scaler.joblib"
+ENCODER_FILE = "label_encoder.joblib"
+MODEL_FILES = {"rf": "random_forest.joblib", "svm": "svm.joblib"}
+SCALER_PATH = os.path.join(MODEL_DIR, SCALER_FILE)
+ENCODER_PATH = os.path.join(MODEL_DIR, ENCODER_FILE)
+RF_PATH = os.path.join(MODEL_DIR, MODEL_FILES["rf"])
+SVM_PATH = os.path.join(MODEL_DIR, MODEL_FILES["svm"])
 
+BATCH_SIZE = 32
 
-def predict_scanner(img_path, model_choice="rf"):
-    print(f"Loading resources from {MODEL_DIR}...")
-    try:
-        scaler = joblib.load(SCALER_PATH)
-        le = joblib.load(ENCODER_PATH)
 
-        if model_choice == "rf":
-            model = joblib.load(RF_PATH)
+def extract_feature_row(img_path):
+    """Decode one image and return its (10,) feature row (runs in pool workers)."""
+    img = load_and_preprocess(img_path)
+    return metadata_feature_matrix(img, [img_path])[0]
+
+
+class BaselinePredictor:
+    """
+    Long-lived baseline predictor: the scaler, label encoder and RF / SVM
+    model are loaded once, then reused for every prediction.
+    predict_many() decodes a batch, extracts features with one fused
+    metadata_feature_matrix call and runs a single predict_proba.
+    """
+
+    def __init__(self, model_choice="rf", model_dir=MODEL_DIR):
+        print(f"Loading resources from {model_dir}...")
+        model_file = MODEL_FILES["rf"] if model_choice == "rf" else MODEL_FILES["svm"]
+        self.model_choice = model_choice
+        self.scaler = joblib.load(os.path.join(model_dir, SCALER_FILE))
+        self.le = joblib.load(os.path.join(model_dir, ENCODER_FILE))
+        # RF prefers the mmap'd random_forest_compact/ export when present
+        self.model = load_model(os.path.join(model_dir, model_file))
+        self.class_names = self.le.classes_
+
+    def features(self, img_paths):
+        """(B, 10) feature matrix for readable images, plus the indices they came from."""
+        imgs, valid = [], []
+        for i, path in enumerate(img_paths):
+            try:
+                imgs.append(load_and_preprocess(path))
+                valid.append(i)
+            except ValueError as e:
+                print(e)
+        if not imgs:
+            return np.empty((0, len(FEATURE_COLUMNS))), valid
+        # load_and_preprocess resizes to METADATA_SIZE, so the batch stacks
+        X = metadata_feature_matrix(np.stack(imgs), [img_paths[i] for i in valid])
+        return X, valid
+
+    def predict_features(self, X):
+        """Labels and probabilities (None for models without predict_proba) for a feature matrix."""
+        # DataFrame keeps the feature names the scaler was fitted with
+        X_scaled = self.scaler.transform(pd.DataFrame(X, columns=FEATURE_COLUMNS))
+        if hasattr(self.model, "predict_proba"):
+            proba = self.model.predict_proba(X_scaled)
+            y_pred = self.model.classes_[np.argmax(proba, axis=1)]
         else:
-            model = joblib.load(SVM_PATH)
+            proba = None
+            y_pred = self.model.predict(X_scaled)
+        return self.le.inverse_transform(y_pred), proba
+
+    def predict_many(self, img_paths, batch_size=BATCH_SIZE):
+        """
+        Predict a list of images.
+
+        Returns:
+            list of (pred_label, proba) aligned with img_paths;
+            (None, None) for images that could not be read
+        """
+        results = [(None, None)] * len(img_paths)
+        for start in range(0, len(img_paths), batch_size):
+            chunk = img_paths[start:start + batch_size]
+            X, valid = self.features(chunk)
+            if not valid:
+                continue
+            labels, proba = self.predict_features(X)
+            for j, i in enumerate(valid):
+                results[start + i] = (labels[j], proba[j] if proba is not None else None)
+        return results
+
+    def predict_stream(self, img_paths, workers=DEFAULT_WORKERS, chunksize=DEFAULT_CHUNKSIZE,
+                       batch_size=BATCH_SIZE):
+        """
+        Classify many images with decode + feature extraction on a process
+        pool. Workers keep decoding ahead while this process scales and
+        predicts the previous batch.
+
+        Yields:
+            (img_path, pred_label, proba, error) in input order; pred_label
+            and proba are None and error is set for unreadable images
+        """
+        pending = []
+        for img_path, row, error in iter_parallel(extract_feature_row, list(img_paths), workers, chunksize):
+            pending.append((img_path, row, error))
+            if len(pending) >= batch_size:
+                yield from self._predict_pending(pending)
+                pending = []
+        yield from self._predict_pending(pending)
+
+    def _predict_pending(self, pending):
+        rows = [row for _, row, error in pending if error is None]
+        if rows:
+            labels, proba = self.predict_features(np.stack(rows))
+        j = 0
+        for img_path, row, error in pending:
+            if error is not None:
+                yield img_path, None, None, error
+                continue
+            yield img_path, labels[j], proba[j] if proba is not None else None, None
+            j += 1
+
+    def predict(self, img_path):
+        pred_label, proba = self.predict_many([img_path])[0]
+        return pred_label, proba, self.class_names
+
+
+_PREDICTORS = {}
+
+
+def get_predictor(model_choice="rf", model_dir=MODEL_DIR):
+    """Process-wide BaselinePredictor per model, created on first use."""
+    key = (model_choice, model_dir)
+    if key not in _PREDICTORS:
+        _PREDICTORS[key] = BaselinePredictor(model_choice, model_dir)
+    return _PREDICTORS[key]
+
+
+def predict_scanner(img_path, model_choice="rf"):
+    try:
+        predictor = get_predictor(model_choice)
     except FileNotFoundError as e:
         print(f"Error: {e}")
         return None, None, None
 
-    # Preprocess and extract features
-    try:
-        img = load_and_preprocess(img_path)
-    except ValueError as e:
-        print(e)
+    pred_label, proba, class_names = predictor.predict(img_path)
+    if pred_label is None:
         return None, None, None
-        
-    features = compute_metadata_features(img, img_path)
-
-    # DataFrame in same column order as training
-    feature_cols = [
-        "width", "height", "aspect_ratio", "file_size_kb",
-        "mean_intensity", "std_intensity", "skewness", "kurtosis",
-        "entropy", "edge_density",
-    ]
-    df = pd.DataFrame([[features[c] for c in feature_cols]], columns=feature_cols)
-
-    # Scale and predict
-    X_scaled = scaler.transform(df)
-    y_pred_encoded = model.predict(X_scaled)[0]
-
-    # Decode to original class_label
-    pred_label = le.inverse_transform([y_pred_encoded])[0]
-
-    # Probabilities (RandomForest supports predict_proba; SVM only if probability=True)
-    if hasattr(model, "predict_proba"):
-        proba = model.predict_proba(X_scaled)[0]
-        class_names = le.classes_
-    else:
-        proba = None
-        class_names = le.classes_
-
     return pred_label, proba, class_names
 
 
+def predict_many(img_paths, model_choice="rf", batch_size=BATCH_SIZE):
+    """Batch version of predict_scanner: list of (pred_label, proba) aligned with img_paths."""
+    return get_predictor(model_choice).predict_many(img_paths, batch_size=batch_size)
+
+
+class ResultWriter:
+    """Stream predictions to CSV or JSONL (by extension), flushing each batch."""
+
+    def __init__(self, path, class_names):
+        self.path = path
+        self.class_names = [str(c) for c in class_names]
+        self.jsonl = path.lower().endswith((".jsonl", ".json"))
+        self._file = open(path, "w", newline="")
+        if not self.jsonl:
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(["Image", "Predicted_Label", "Confidence(%)", "Error"])
+
+    def write(self, img_path, pred_label, proba, error):
+        conf = float(np.max(proba) * 100) if proba is not None else None
+        if self.jsonl:
+            rec = {"image": img_path, "predicted_label": None if pred_label is None else str(pred_label),
+                   "confidence": conf, "error": error}
+            if proba is not None:
+                rec["probabilities"] = dict(zip(self.class_names, map(float, proba)))
+            self._file.write(json.dumps(rec) + "\n")
+        else:
+            self._csv.writerow([img_path, "" if pred_label is None else pred_label,
+                                "" if conf is None else f"{conf:.2f}", error or ""])
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def collect_inputs(inputs, file_list=None, exts=IMAGE_EXTS):
+    """Image paths from files, directory trees (walked recursively, sorted) and/or a text file list."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(exts))
+        else:
+            paths.append(item)
+    if file_list:
+        with open(file_list) as f:
+            paths.extend(line.strip() for line in f if line.strip())
+    return paths
+
+
+def predict_folder(inputs, output_path="baseline_predictions.csv", model_choice="rf", file_list=None,
+                   workers=DEFAULT_WORKERS, chunksize=DEFAULT_CHUNKSIZE, batch_size=BATCH_SIZE,
+                   model_dir=MODEL_DIR):
+    """Classify every image under `inputs`, streaming results to output_path. Returns the summary dict."""
+    img_paths = collect_inputs(inputs, file_list)
+    print(f"Found {len(img_paths)} images")
+    predictor = get_predictor(model_choice, model_dir)
+    writer = ResultWriter(output_path, predictor.class_names)
+
+    start = time.perf_counter()
+    done = failed = 0
+    try:
+        for img_path, pred_label, proba, error in predictor.predict_stream(img_paths, workers, chunksize, batch_size):
+            writer.write(img_path, pred_label, proba, error)
+            done += 1
+            if error is not None:
+                failed += 1
+                print(f"{img_path} -> FAILED ({error})")
+            if done % batch_size == 0:
+                writer.flush()
+                elapsed = time.perf_counter() - start
+                print(f" {done}/{len(img_paths)} images | {done / elapsed:.1f} images/s")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"\n Classified {done - failed} images ({failed} failed) in {elapsed:.2f}s -> {rate:.1f} images/s")
+    print(f" Predictions saved to {output_path}")
+    return {"images": done, "failed": failed, "seconds": elapsed, "images_per_s": rate}
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Run baseline (RF / SVM) inference on images, folders or a file list.")
+    p.add_argument("inputs", nargs="*", help="Image files and/or folders (searched recursively).")
+    p.add_argument("--file-list", help="Text file with one image path per line.")
+    p.add_argument("--model", "-m", choices=["rf", "svm"], default="rf", help="Baseline model to use.")
+    p.add_argument("--model-dir", default=MODEL_DIR, help="Folder with the baseline .joblib artifacts.")
+    p.add_argument("--output", "-o", default="baseline_predictions.csv", help="Output .csv or .jsonl file.")
+    p.add_argument("--workers", "-w", type=int, default=DEFAULT_WORKERS, help="Decode / feature worker processes.")
+    p.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Images sent to a worker per round-trip.")
+    p.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Images per scaler / model call.")
+    return p.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+
+    if args.inputs or args.file_list:
+        predict_folder(args.inputs, args.output, args.model, args.file_list,
+                       args.workers, args.chunksize, args.batch_size, args.model_dir)
+        sys.exit(0)
+
     test_image = os.path.join(PROJECT_ROOT, "data/Official/EpsonV39-1/300/s8_1.tif")
     
     if os.path.exists(test_image):
         print(f"Testing with image: {test_image}")
-        pred, proba, class_names = predict_scanner(test_image, model_choice="rf")
+        pred, proba, class_names = predict_scanner(test_image, model_choice=args.model)
         
         if pred is not None:
             print("Predicted Scanner:", pred)
@@ -2,23 +2,38 @@ import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.svm import SVC
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
+import json
 import os
+import time
+import sys
+import argparse
 
-# Paths
-CSV_PATH = "processed_data/combined_metadata.csv"
+# Make src/ importable when run as a script (python src/baseline/train_baseline.py)
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
+
+from preprocessing import read_metadata, write_metadata, find_table, with_format, table_format
+from preprocessing import FEATURE_COLUMNS, ID_COLUMNS
+from baseline import model_search, compact_model
+from baseline.calibration import CalibratedSVM, support_vector_count
+from baseline.predict_baseline import MODEL_FILES
+
+# Paths (the newer of combined_metadata.parquet / .csv)
+DATA_PATH = find_table("processed_data/combined_metadata")
 MODEL_DIR = "models/baseline"
 os.makedirs(MODEL_DIR, exist_ok=True)
 
-def train_baseline_models():
-    print(f"Loading data from {CSV_PATH}...")
+def train_baseline_models(search=False, n_splits=5, n_jobs=-1, calibrate_svm=False):
+    """n_jobs parallelises the CV search and model fitting; saved models predict with n_jobs=1."""
+    print(f"Loading data from {DATA_PATH}...")
     try:
-        df = pd.read_csv(CSV_PATH)
+        # Only the columns we need (column projection for Parquet)
+        df = read_metadata(DATA_PATH, columns=ID_COLUMNS + FEATURE_COLUMNS)
     except FileNotFoundError:
-        print(f"Error: {CSV_PATH} not found. Run preprocessing first.")
+        print(f"Error: {DATA_PATH} not found. Run preprocessing first.")
         return
 
     if df.empty:
@@ -29,9 +44,7 @@ def train_baseline_models():
     print(f"Sources: {df['main_class'].unique()}")
 
     # Features and Target
-    # Dropping non-feature columns
-    drop_cols = ["file_name", "main_class", "resolution", "class_label"]
-    feature_cols = [c for c in df.columns if c not in drop_cols]
+    feature_cols = FEATURE_COLUMNS
     
     X = df[feature_cols]
     y = df["class_label"]
@@ -58,9 +71,9 @@ def train_baseline_models():
         df, test_size=0.2, random_state=42, stratify=df['encoded_label']
     )
     
-    # Save test split for independent evaluation
-    test_csv_path = "processed_data/test_split.csv"
-    test_df.to_csv(test_csv_path, index=False)
+    # Save test split for independent evaluation (same format as the input table)
+    test_csv_path = with_format("processed_data/test_split.csv", table_format(DATA_PATH))
+    write_metadata(test_df, test_csv_path)
     print(f"Test split saved to {test_csv_path}")
 
     # Prepare X and y for training
@@ -76,31 +89,71 @@ def train_baseline_models():
     X_test_scaled = scaler.transform(X_test)
     joblib.dump(scaler, os.path.join(MODEL_DIR, "scaler.joblib"))
 
-    # --- Random Forest ---
-    print("\n--- Training Random Forest ---")
-    rf = RandomForestClassifier(n_estimators=100, random_state=42)
-    rf.fit(X_train_scaled, y_train)
-    
-    y_pred_rf = rf.predict(X_test_scaled)
-    acc_rf = accuracy_score(y_test, y_pred_rf)
-    print(f"Random Forest Accuracy: {acc_rf:.4f}")
-    print("Classification Report (RF):")
-    print(classification_report(y_test, y_pred_rf, target_names=le.classes_))
-    
-    joblib.dump(rf, os.path.join(MODEL_DIR, "random_forest.joblib"))
+    # Hyperparameters: fixed defaults, or the best CV configuration
+    params = {"rf": {"n_estimators": 100}, "svm": {"C": 1.0}}
+    report = {"search": None, "models": {}}
+    if search:
+        results = model_search.search(X_train, y_train, n_splits=n_splits, n_jobs=n_jobs)
+        model_search.print_results(results)
+        params = {name: model_search.best_params(results, name) for name in params}
+        report["search"] = results
+        report["best"] = results[0]
+        print(f"Best overall: {results[0]['model']} {results[0]['params']} (cv {results[0]['cv_accuracy']:.4f})")
 
-    # --- SVM ---
-    print("\n--- Training SVM ---")
-    svm = SVC(kernel='rbf', C=1.0, random_state=42)
-    svm.fit(X_train_scaled, y_train)
-    
-    y_pred_svm = svm.predict(X_test_scaled)
-    acc_svm = accuracy_score(y_test, y_pred_svm)
-    print(f"SVM Accuracy: {acc_svm:.4f}")
-    print("Classification Report (SVM):")
-    print(classification_report(y_test, y_pred_svm, target_names=le.classes_))
-    
-    joblib.dump(svm, os.path.join(MODEL_DIR, "svm.joblib"))
+    for name, title in [("rf", "Random Forest"), ("svm", "SVM")]:
+        print(f"\n--- Training {title} ---")
+        print(f"Params: {params[name]}")
+        model = model_search.make_model(name, params[name], n_jobs=n_jobs)
+        if name == "svm" and calibrate_svm:
+            # Probabilities from a held-out calibration split, not SVC(probability=True)
+            model = CalibratedSVM(model)
+        t0 = time.perf_counter()
+        model.fit(X_train_scaled, y_train)
+        fit_s = time.perf_counter() - t0
+        # Timed and saved as served: single-threaded predict
+        model_search.for_serving(model)
+        y_pred, latency = model_search.time_predict(model, X_test_scaled)
+
+        single = model_search.single_latency(model, X_test_scaled)
+
+        acc = accuracy_score(y_test, y_pred)
+        print(f"{title} Accuracy: {acc:.4f} | fit {fit_s:.2f}s | "
+              f"batch {latency * 1000:.4f} ms/image | single {single * 1000:.2f} ms/image")
+        n_sv = support_vector_count(model)
+        if n_sv is not None:
+            print(f"Support vectors: {n_sv}")
+        if hasattr(model, "predict_proba"):
+            proba_latency = model_search.single_latency(model, X_test_scaled, method="predict_proba")
+            print(f"predict_proba: {proba_latency * 1000:.2f} ms/image")
+        print(f"Classification Report ({name.upper()}):")
+        print(classification_report(y_test, y_pred, target_names=le.classes_))
+
+        model_path = os.path.join(MODEL_DIR, MODEL_FILES[name])
+        joblib.dump(model, model_path)
+        if name == "rf":
+            # Memory-mappable copy used by the predictors
+            compact_model.export_forest(model, compact_model.compact_dir(model_path), model_path)
+        report["models"][name] = {
+            "params": params[name], "test_accuracy": float(acc),
+            "fit_s": fit_s, "latency_ms": latency * 1000, "single_latency_ms": single * 1000,
+            "support_vectors": n_sv, "calibrated": name == "svm" and calibrate_svm,
+        }
+
+    with open(os.path.join(MODEL_DIR, "training_report.json"), "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    return report
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Train the baseline RF / SVM models.")
+    p.add_argument("--search", action="store_true",
+                   help="Pick hyperparameters by parallel stratified k-fold CV over RF / SVM grids.")
+    p.add_argument("--folds", type=int, default=model_search.N_SPLITS, help="CV folds for --search.")
+    p.add_argument("--calibrate-svm", action="store_true",
+                   help="Save the SVM with probabilities calibrated on a held-out split.")
+    p.add_argument("--jobs", "-j", type=int, default=-1, help="Parallel jobs for the --search CV and the final fits (-1 = all cores).")
+    return p.parse_args()
 
 if __name__ == "__main__":
-    train_baseline_models()
\ No newline at end of file
+    args = parse_args()
+    train_baseline_models(search=args.search, n_splits=args.folds, n_jobs=args.jobs,
+                          calibrate_svm=args.calibrate_svm)
@@ -0,0 +1,149 @@
+"""
+bench_denoisers.py
+Speed vs fingerprint quality of every registered residual denoiser.
+For each method: images/s of batched noise_residual(), then per-scanner
+fingerprints (mean train residual) and normalised correlation of held-out
+residuals against every fingerprint:
+    acc      argmax-correlation scanner accuracy on the test images
+    corr     mean correlation with the correct fingerprint
+    margin   mean (correct - best wrong) correlation
+    prnu     (synthetic only) correlation of each fingerprint with the true pattern
+
+    python src/benchmarks/bench_denoisers.py                      # synthetic PRNU scanners
+    python src/benchmarks/bench_denoisers.py --data data/Flatfield --per-scanner 20
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from scipy import ndimage
+
+# Make src/ importable when run as a script
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
+
+from preprocessing import DENOISERS, canonical_denoiser, noise_residual, load_residual_input, RESIDUAL_SIZE, IMAGE_EXTS
+
+
+def synthetic_scanners(n_scanners, per_scanner, size, seed=0):
+    """Smooth scenes x (1 + scanner PRNU) + shot noise; returns (images, labels, patterns)."""
+    rng = np.random.default_rng(seed)
+    patterns = rng.normal(0, 0.02, (n_scanners,) + size).astype(np.float32)
+    images, labels = [], []
+    for k in range(n_scanners):
+        for _ in range(per_scanner):
+            scene = ndimage.gaussian_filter(rng.random(size), sigma=6)
+            scene = 0.2 + 0.6 * (scene - scene.min()) / (np.ptp(scene) + 1e-8)
+            img = scene * (1 + patterns[k]) + rng.normal(0, 0.01, size)
+            images.append(np.clip(img, 0, 1).astype(np.float32))
+            labels.append(k)
+    return np.stack(images), np.array(labels), patterns
+
+
+def folder_scanners(data_dir, per_scanner, size):
+    """First-level subfolders are scanners; up to per_scanner images each (searched recursively)."""
+    images, labels, names = [], [], []
+    for scanner in sorted(os.listdir(data_dir)):
+        scanner_dir = os.path.join(data_dir, scanner)
+        if not os.path.isdir(scanner_dir):
+            continue
+        files = sorted(os.path.join(root, f) for root, _, fs in os.walk(scanner_dir)
+                       for f in fs if f.lower().endswith(IMAGE_EXTS))
+        count = 0
+        for path in files:
+            img = load_residual_input(path, size)
+            if img is None:
+                continue
+            images.append(img)
+            labels.append(len(names))
+            count += 1
+            if count == per_scanner:
+                break
+        if count:
+            names.append(scanner)
+    if len(names) < 2:
+        raise SystemExit(f"Need at least two scanner folders with images in {data_dir}")
+    return np.stack(images).astype(np.float32), np.array(labels), names
+
+
+def normalise(x):
+    x = x.reshape(len(x), -1).astype(np.float64)
+    x = x - x.mean(axis=1, keepdims=True)
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-12)
+
+
+def split(labels, train_frac=0.5):
+    """Per-scanner first train_frac images for fingerprints, the rest for testing."""
+    train = np.zeros(len(labels), dtype=bool)
+    for k in np.unique(labels):
+        idx = np.flatnonzero(labels == k)
+        train[idx[:max(1, int(len(idx) * train_frac))]] = True
+    return train
+
+
+def residuals_timed(images, method, batch):
+    out = np.empty_like(images)
+    noise_residual(images[:1], method)  # warm-up
+    t0 = time.perf_counter()
+    for i in range(0, len(images), batch):
+        out[i:i + batch] = noise_residual(images[i:i + batch], method)
+    return out, time.perf_counter() - t0
+
+
+def score(residuals, labels, train, patterns=None):
+    n_classes = labels.max() + 1
+    fps = np.stack([residuals[train & (labels == k)].mean(axis=0) for k in range(n_classes)])
+    test = ~train
+    corr = normalise(residuals[test]) @ normalise(fps).T
+    y = labels[test]
+    rows = np.arange(len(y))
+    correct = corr[rows, y]
+    wrong = corr.copy()
+    wrong[rows, y] = -np.inf
+    result = {
+        "acc": float(np.mean(corr.argmax(axis=1) == y)),
+        "corr": float(correct.mean()),
+        "margin": float((correct - wrong.max(axis=1)).mean()),
+    }
+    if patterns is not None:
+        result["prnu"] = float(np.mean(np.sum(normalise(fps) * normalise(patterns), axis=1)))
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark residual denoisers: images/s and fingerprint quality.")
+    p.add_argument("--methods", nargs="+", choices=sorted(DENOISERS), default=None,
+                   help="Denoisers to compare (default: all registered).")
+    p.add_argument("--data", default=None, help="Folder of <scanner>/... images (default: synthetic scanners).")
+    p.add_argument("--scanners", type=int, default=4, help="Synthetic scanners.")
+    p.add_argument("--per-scanner", type=int, default=16, help="Images per scanner (half build fingerprints).")
+    p.add_argument("--size", type=int, default=RESIDUAL_SIZE[0])
+    p.add_argument("--batch", type=int, default=16, help="Images per denoiser call.")
+    args = p.parse_args()
+
+    size = (args.size, args.size)
+    patterns = None
+    if args.data:
+        images, labels, names = folder_scanners(args.data, args.per_scanner, size)
+        print(f"{len(images)} images from {len(names)} scanners in {args.data}")
+    else:
+        images, labels, patterns = synthetic_scanners(args.scanners, args.per_scanner, size)
+        print(f"{len(images)} synthetic images from {args.scanners} scanners")
+    train = split(labels)
+
+    # Aliases ("wavelet" -> "haar") are benchmarked once
+    methods = args.methods or [m for m in DENOISERS if canonical_denoiser(m) == m]
+    header = f"{'method':<16} {'images/s':>9} {'acc':>6} {'corr':>7} {'margin':>7}"
+    print(header + (f" {'prnu':>6}" if patterns is not None else ""))
+    for method in methods:
+        residuals, dt = residuals_timed(images, method, args.batch)
+        s = score(residuals, labels, train, patterns)
+        line = f"{method:<16} {len(images) / dt:9.0f} {s['acc']:6.3f} {s['corr']:7.4f} {s['margin']:7.4f}"
+        print(line + (f" {s['prnu']:6.3f}" if "prnu" in s else ""))
+
+
+if __name__ == "__main__":
+    main()
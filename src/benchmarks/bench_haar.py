@@ -0,0 +1,99 @@
+"""
+bench_haar.py
+Haar residual benchmark: the old per-image pywt.dwt2 / idwt2 loop vs the
+batched preprocessing.haar_residual (and the TensorFlow path when installed).
+Reports images/s per backend and the max abs difference to pywt.
+
+    python src/benchmarks/bench_haar.py --batch 64 --size 256
+    python src/benchmarks/bench_haar.py --images data/Official/EpsonV39-1/300
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pywt
+
+# Make src/ importable when run as a script
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
+
+from preprocessing import haar_residual, load_residual_input, RESIDUAL_SIZE, IMAGE_EXTS
+
+
+def pywt_residual(img):
+    """Previous CPU implementation (hybrid_cnn/processing.py), cropped for odd sizes."""
+    h, w = img.shape
+    cA, (cH, cV, cD) = pywt.dwt2(img, 'haar')
+    cH[:] = 0; cV[:] = 0; cD[:] = 0
+    return (img - pywt.idwt2((cA, (cH, cV, cD)), 'haar')[:h, :w]).astype(np.float32)
+
+
+def pywt_loop(batch):
+    return np.stack([pywt_residual(img) for img in batch])
+
+
+def tf_batch():
+    """hybrid_cnn.utils.residual_batch_gpu, or None without TensorFlow."""
+    try:
+        import tensorflow  # noqa: F401
+    except ImportError:
+        return None
+    sys.path.append(os.path.join(SRC_DIR, "hybrid_cnn"))
+    from utils import residual_batch_gpu
+    return residual_batch_gpu
+
+
+def load_batch(folder, n, size):
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTS))
+    imgs = [load_residual_input(os.path.join(folder, f), size) for f in files[:n]]
+    imgs = [im for im in imgs if im is not None]
+    if not imgs:
+        raise SystemExit(f"No readable images in {folder}")
+    return np.stack(imgs).astype(np.float32)
+
+
+def bench(fn, batch, repeats):
+    fn(batch[:1])  # warm-up (TF graph / allocations)
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn(batch)
+        times.append(time.perf_counter() - t0)
+    return out, min(times)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark Haar residual implementations.")
+    p.add_argument("--batch", type=int, default=64, help="Images per batch.")
+    p.add_argument("--size", type=int, default=RESIDUAL_SIZE[0], help="Square image size (random inputs).")
+    p.add_argument("--images", default=None, help="Folder of real scans to use instead of random inputs.")
+    p.add_argument("--repeats", type=int, default=5)
+    args = p.parse_args()
+
+    size = (args.size, args.size)
+    if args.images:
+        batch = load_batch(args.images, args.batch, size)
+    else:
+        batch = np.random.default_rng(0).random((args.batch,) + size, dtype=np.float32)
+    print(f"Batch: {batch.shape[0]} x {batch.shape[1]}x{batch.shape[2]}, best of {args.repeats}")
+
+    backends = {"pywt loop": pywt_loop, "numpy batched": haar_residual}
+    tf_fn = tf_batch()
+    if tf_fn is not None:
+        backends["tensorflow"] = tf_fn
+    else:
+        print("TensorFlow not installed: skipping the TF backend")
+
+    ref, ref_s = bench(pywt_loop, batch, args.repeats)
+    print(f"{'backend':<15} {'images/s':>10} {'speedup':>8} {'max |diff|':>11}")
+    for name, fn in backends.items():
+        out, dt = (ref, ref_s) if fn is pywt_loop else bench(fn, batch, args.repeats)
+        diff = float(np.abs(out - ref).max())
+        print(f"{name:<15} {len(batch) / dt:10.0f} {ref_s / dt:7.1f}x {diff:11.2e}")
+
+
+if __name__ == "__main__":
+    main()
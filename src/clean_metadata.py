@@ -1,29 +1,38 @@
-import pandas as pd
+import os
+import argparse
+from preprocessing import find_table, with_format, table_format, stream_merge, CHUNK_ROWS
 
-def clean_metadata(input_path, output_path):
+def clean_metadata(input_path, output_path, columns=None, chunksize=CHUNK_ROWS):
     print("-" * 60)
     print("Cleaning:", input_path)
     try:
-        data = pd.read_csv(input_path)
-        print("Original data shape:", data.shape)
-        data = data.drop_duplicates()
-        data = data.dropna(how='all')
-        print("Cleaned data shape:", data.shape)
-        data.to_csv(output_path, index=False)
+        # Streamed in chunks (CSV or Parquet by extension); `columns` limits what is read
+        stats = stream_merge([input_path], output_path, columns=columns, chunksize=chunksize)
+        print("Original rows:", stats["read"])
+        print(f"Dropped {stats['duplicates']} duplicate and {stats['empty']} empty rows")
+        print("Cleaned rows:", stats["written"])
         print("File saved successfully at:", output_path)
     except Exception as e:
         print("ERROR processing", input_path)
         print(str(e))
 
+def cleaned_path(input_path):
+    # processed_data/<name>/metadata_features.csv -> processed_data/<name>/<name>_metadata_cleaned.csv
+    folder = os.path.dirname(input_path)
+    name = os.path.basename(folder).lower()
+    return with_format(os.path.join(folder, f"{name}_metadata_cleaned.csv"), table_format(input_path))
+
 if __name__ == "__main__":
-    # Official cleaning
-    clean_metadata(
-        'processed_data/official/metadata_features.csv',           # Input: Official metadata
-        'processed_data/official/official_metadata_cleaned.csv'    # Output: Official cleaned
-    )
+    parser = argparse.ArgumentParser(description="Drop duplicate / empty rows from metadata tables.")
+    parser.add_argument("inputs", nargs="*",
+                        help="metadata tables to clean (default: official + wikipedia metadata_features)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS, help="rows per streamed chunk")
+    args = parser.parse_args()
 
-    # Wikipedia cleaning
-    clean_metadata(
-        'processed_data/wikipedia/metadata_features.csv',     # Input: Wikipedia metadata
-        'processed_data/wikipedia/wikipedia_metadata_cleaned.csv'  # Output: Wikipedia cleaned
-    )
+    # Inputs may be metadata_features.csv or .parquet; outputs keep the same format
+    inputs = args.inputs or [
+        find_table('processed_data/official/metadata_features'),     # -> official_metadata_cleaned
+        find_table('processed_data/wikipedia/metadata_features'),    # -> wikipedia_metadata_cleaned
+    ]
+    for input_path in inputs:
+        clean_metadata(input_path, cleaned_path(input_path), chunksize=args.chunksize)
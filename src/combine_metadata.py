@@ -1,17 +1,26 @@
-import pandas as pd
+import argparse
+from preprocessing import find_table, with_format, table_format, stream_merge, CHUNK_ROWS
 
-def combine_metadata(official_csv, wikipedia_csv, output_csv):
-    df_official = pd.read_csv(official_csv)
-    df_wiki = pd.read_csv(wikipedia_csv)
-    df_combined = pd.concat([df_official, df_wiki], ignore_index=True)
-    df_combined = df_combined.drop_duplicates()
-    df_combined = df_combined.dropna(how='all')
-    df_combined.to_csv(output_csv, index=False)
-    print("Metadata combining done! Output:", output_csv)
+def combine_metadata(input_paths, output_path, columns=None, chunksize=CHUNK_ROWS):
+    # Any number and mix of CSV / Parquet inputs, streamed in chunks and
+    # deduplicated across all of them; output format follows output_path's extension
+    stats = stream_merge(input_paths, output_path, columns=columns, chunksize=chunksize)
+    print(f"Combined {len(input_paths)} tables: {stats['read']} rows in, {stats['written']} rows out "
+          f"({stats['duplicates']} duplicates, {stats['empty']} empty)")
+    print("Metadata combining done! Output:", output_path)
 
 if __name__ == "__main__":
-    combine_metadata(
-        'processed_data/official/official_metadata_cleaned.csv',
-        'processed_data/wikipedia/wikipedia_metadata_cleaned.csv',
-        'processed_data/combined_metadata.csv'
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Merge cleaned metadata tables into one.")
+    parser.add_argument("inputs", nargs="*",
+                        help="tables to merge, in order (default: official + wikipedia cleaned metadata)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="output table (default: processed_data/combined_metadata, in the first input's format)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS, help="rows per streamed chunk")
+    args = parser.parse_args()
+
+    inputs = args.inputs or [
+        find_table('processed_data/official/official_metadata_cleaned'),
+        find_table('processed_data/wikipedia/wikipedia_metadata_cleaned'),
+    ]
+    output = args.output or with_format('processed_data/combined_metadata.csv', table_format(inputs[0]))
+    combine_metadata(inputs, output, chunksize=args.chunksize)
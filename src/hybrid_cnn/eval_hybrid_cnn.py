@@ -4,8 +4,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 from sklearn.model_selection import train_test_split
-from tensorflow.keras.utils import to_categorical
-from utils import corr2d, extract_enhanced_features
+from utils import extract_enhanced_features
+from preprocessing import ResidualStore, FingerprintBank
 
 # ---- Paths ----
 BASE_DIR = "data"
@@ -13,7 +13,9 @@ ART_DIR   = "results/hybrid_cnn"
 MODEL_PATH = os.path.join(ART_DIR, "scanner_hybrid_final.keras")
 ENCODER_PATH = os.path.join(ART_DIR, "hybrid_label_encoder.pkl")
 SCALER_PATH  = os.path.join(ART_DIR, "hybrid_feat_scaler.pkl")
-RES_PATH = os.path.join(ART_DIR, "official_wiki_residuals.pkl")
+STORE_DIR = os.path.join(ART_DIR, "residual_store")
+DATASETS = ["official", "Wikipedia"]
+BATCH = 32
 FP_PATH  = os.path.join(ART_DIR, "scanner_fingerprints.pkl")
 ORDER_NPY = os.path.join(ART_DIR, "fp_keys.npy")
 FEATURES_PATH = os.path.join(ART_DIR, "features.pkl")
@@ -33,9 +35,11 @@ with open(SCALER_PATH, "rb") as f:
     scaler = pickle.load(f)
 
 # ---- Load Data ----
-print("Loading residuals...")
-with open(RES_PATH, "rb") as f:
-    residuals_dict = pickle.load(f)
+# Residuals stay in the memory-mapped store; only the test set is read
+print("Opening residual store...")
+store = ResidualStore(STORE_DIR)
+rec_idx = store.select(DATASETS)
+y_all = store.labels[rec_idx]
 
 # Optional: Load pre-computed features
 precomputed = False
@@ -57,57 +61,40 @@ else:
     else:
         raise FileNotFoundError("Scanner fingerprints not found.")
 
-# ---- Reconstruct Full Dataset ----
-X_img_all, X_feat_all, y_all = [], [], []
-idx_counter = 0
-
-for dataset_name in ["official", "Wikipedia"]:
-    if dataset_name not in residuals_dict:
-        continue
-    
-    print(f"Processing {dataset_name}...")
-    for scanner, dpi_dict in residuals_dict[dataset_name].items():
-        if isinstance(dpi_dict, dict):
-            for dpi, res_list in dpi_dict.items():
-                for res in res_list:
-                    X_img_all.append(np.expand_dims(res, -1))
-                    
-                    if precomputed:
-                        f_p = feats_prnu[idx_counter]
-                        f_e = feats_enh[idx_counter]
-                        X_feat_all.append(f_p + f_e)
-                    else:
-                        v_corr = [corr2d(res, scanner_fps[k]) for k in fp_keys]
-                        v_enh = extract_enhanced_features(res)
-                        X_feat_all.append(v_corr + v_enh)
-                        
-                    y_all.append(scanner)
-                    idx_counter += 1
-
-X_img_all = np.array(X_img_all, dtype=np.float32)
-X_feat_all = np.array(X_feat_all, dtype=np.float32)
-y_all = np.array(y_all)
-
 # ---- Split to Recover Test Set ----
 y_int_all = le.transform(y_all)
 num_classes = len(le.classes_)
-y_cat_all = to_categorical(y_int_all, num_classes)
 
 print("Splitting data to recover Test Set...")
-_, X_img_te, _, X_feat_te, _, y_te = train_test_split(
-    X_img_all, X_feat_all, y_cat_all, test_size=0.2, random_state=SEED, stratify=y_int_all
+# Same split as train_hybrid_cnn.py (positions only; residuals are not loaded)
+_, pos_te = train_test_split(
+    np.arange(len(rec_idx)), test_size=0.2, random_state=SEED, stratify=y_int_all
 )
+y_int_te = y_int_all[pos_te]
 
-y_int_te = np.argmax(y_te, axis=1)
+X_feat_te = []
+if precomputed:
+    for k in pos_te:
+        X_feat_te.append(feats_prnu[k] + feats_enh[k])
+else:
+    fp_bank = FingerprintBank.from_fingerprints(scanner_fps, fp_keys)
+    for _, batch in store.iter_batches(rec_idx[pos_te], BATCH):
+        # One GEMM per batch for the PRNU correlations
+        for res, v_corr in zip(batch, fp_bank.correlate(batch).tolist()):
+            X_feat_te.append(v_corr + extract_enhanced_features(res))
 
 # Scale Features
-X_feat_te = scaler.transform(X_feat_te)
+X_feat_te = scaler.transform(np.array(X_feat_te, dtype=np.float32))
 
-print(f"Test Set: {len(X_img_te)} samples")
+print(f"Test Set: {len(pos_te)} samples")
 
 # ---- Evaluate ----
 print("Running prediction...")
-y_pred_prob = model.predict([X_img_te, X_feat_te])
+# Test residuals are read from the store one batch at a time
+y_pred_prob = np.concatenate([
+    model.predict([np.expand_dims(store.take(rec_idx[pos_te[i:i + BATCH]]), -1), X_feat_te[i:i + BATCH]], verbose=0)
+    for i in range(0, len(pos_te), BATCH)
+])
 y_pred = np.argmax(y_pred_prob, axis=1)
 
 test_acc = accuracy_score(y_int_te, y_pred)
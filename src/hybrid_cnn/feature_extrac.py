@@ -1,34 +1,69 @@
 import os
 import pickle
+import argparse
 import numpy as np
 from tqdm import tqdm
 from utils import batch_corr_gpu, extract_enhanced_features
+from preprocessing import ResidualStore, FingerprintState, FingerprintBank, SourceImages, FINGERPRINT_ENGINES, BANK_FILE
 
 # Paths (local)
 BASE_DIR = "data"
 
-FLATFIELD_RESIDUALS_PATH = os.path.join(BASE_DIR, "../results/hybrid_cnn/flatfield_residuals.pkl")
+# Sharded residual store written by processing.py (flatfield + official + Wikipedia)
+STORE_DIR = os.path.join(BASE_DIR, "../results/hybrid_cnn/residual_store")
 FP_OUT_PATH = os.path.join(BASE_DIR, "../results/hybrid_cnn/scanner_fingerprints.pkl")
 ORDER_NPY = os.path.join(BASE_DIR, "../results/hybrid_cnn/fp_keys.npy")
+# Normalised (K, D) fingerprint matrix in fp_keys order (test.py / dashboard load it directly)
+FP_BANK_PATH = os.path.join(BASE_DIR, "../results/hybrid_cnn", BANK_FILE)
+# Running mean / variance per scanner + folded sources (lets --update add new flatfields)
+FP_STATE_PATH = os.path.join(BASE_DIR, "../results/hybrid_cnn/fingerprint_state.npz")
 
-RES_PATH = os.path.join(BASE_DIR, "../results/hybrid_cnn/official_wiki_residuals.pkl")
 FEATURES_OUT = os.path.join(BASE_DIR, "../results/hybrid_cnn/features.pkl")
 ENHANCED_OUT = os.path.join(BASE_DIR, "../results/hybrid_cnn/enhanced_features.pkl")
+DATASETS = ["official", "Wikipedia"]
 
+parser = argparse.ArgumentParser(description="Scanner fingerprints + PRNU / enhanced features from the residual store.")
+parser.add_argument("--update", action="store_true",
+                    help=f"Fold only flatfield scans not yet in {FP_STATE_PATH} into the saved fingerprints.")
+parser.add_argument("--engine", choices=sorted(FINGERPRINT_ENGINES), default="mean",
+                    help="Fingerprint estimator: mean residual, or intensity-weighted PRNU MLE "
+                         "(reads the flatfield images again; cleaner with fewer scans).")
+args = parser.parse_args()
+
+store = ResidualStore(STORE_DIR) if os.path.exists(os.path.join(STORE_DIR, "store.json")) else None
 
 # Compute scanner fingerprints
-if os.path.exists(FLATFIELD_RESIDUALS_PATH):
-    with open(FLATFIELD_RESIDUALS_PATH, "rb") as f:
-        flatfield_residuals = pickle.load(f)
-
-    scanner_fingerprints = {}
-    print("Computing fingerprints from Flatfields...")
-    for scanner, residuals in flatfield_residuals.items():
-        if not residuals:
-            continue
-        stack = np.stack(residuals, axis=0)     
-        fingerprint = np.mean(stack, axis=0)      
-        scanner_fingerprints[scanner] = fingerprint
+if store is not None and len(store.select(["Flatfield"])):
+    if FINGERPRINT_ENGINES[args.engine].needs_images:
+        # mle re-reads the flatfield images; stores imported with --import-pickles only hold <shard>#<n> names
+        readable = SourceImages(store.paths[store.select(["Flatfield"])]).available()
+        if not readable.any():
+            print(f"Error: {args.engine} needs the original flatfield files, but none of the sources in {STORE_DIR} "
+                  "exist; rebuild the store with processing.py (not --import-pickles) or use --engine mean.")
+            exit(1)
+        if not readable.all():
+            print(f"Warning: {int((~readable).sum())} flatfield sources are missing and will be skipped.")
+
+    # Streaming (Welford) build: one batch of residuals in memory at a time
+    fp_state = FingerprintState.load(FP_STATE_PATH, args.engine) if args.update else FingerprintState(args.engine)
+    if fp_state.discarded_engine:
+        print(f" {FP_STATE_PATH} holds '{fp_state.discarded_engine}' fingerprints, not '{args.engine}'; "
+              "starting from empty.")
+    print(f"{'Updating' if args.update else 'Computing'} {args.engine} fingerprints from Flatfields...")
+    added = 0
+    for _, scanner, _, residuals, idx in store.groups(["Flatfield"]):
+        added += fp_state.update(scanner, residuals, store.paths[idx])
+    for scanner, skipped in fp_state.skipped.items():
+        print(f"  {scanner}: skipped {len(skipped)} unreadable flatfield(s), e.g. {skipped[0]}")
+    if not len(fp_state):
+        print("Error: no flatfield could be folded into a fingerprint.")
+        exit(1)
+    fp_state.save(FP_STATE_PATH)
+    finalise_s = fp_state.finalise_time()
+    scanner_fingerprints = fp_state.fingerprints()
+    print(f"Folded {added} flatfield residuals ({finalise_s:.2f}s post-processing)")
+    for scanner, count in fp_state.counts().items():
+        print(f"  {scanner:<24} {count:5d} scans  {fp_state.build_s.get(scanner, 0.0):7.2f}s")
 
     # Save fingerprints
     os.makedirs(os.path.dirname(FP_OUT_PATH), exist_ok=True)
@@ -38,10 +73,11 @@ if os.path.exists(FLATFIELD_RESIDUALS_PATH):
     # Save deterministic scanner order
     fp_keys = sorted(scanner_fingerprints.keys())
     np.save(ORDER_NPY, np.array(fp_keys))
-    print(f"Saved {len(scanner_fingerprints)} fingerprints and fp_keys.npy")
+    FingerprintBank.from_fingerprints(scanner_fingerprints, fp_keys).save(FP_BANK_PATH)
+    print(f"Saved {len(scanner_fingerprints)} fingerprints, fp_keys.npy and {BANK_FILE}")
 
 else:
-    print(f"Warning: {FLATFIELD_RESIDUALS_PATH} not found. Skipping fingerprint generation.")
+    print(f"Warning: no Flatfield residuals in {STORE_DIR}. Skipping fingerprint generation.")
     if os.path.exists(FP_OUT_PATH):
         with open(FP_OUT_PATH, "rb") as f:
             scanner_fingerprints = pickle.load(f)
@@ -56,26 +92,16 @@ else:
 # ---------------------------
 # 2) PRNU Features (Batch GPU)
 # ---------------------------
-if os.path.exists(RES_PATH):
-    # Load residuals
-    with open(RES_PATH, "rb") as f:
-        residuals_dict = pickle.load(f)
-
+if store is not None and len(store.select(DATASETS)):
     features, labels = [], []
-    
-    for dataset_name in ["official", "Wikipedia"]:
-        if dataset_name not in residuals_dict:
-            print(f"Dataset {dataset_name} not in residuals.")
-            continue
-            
-        print(f"Computing PRNU features for {dataset_name} (GPU Batch) ...")
-        for scanner, dpi_dict in tqdm(residuals_dict[dataset_name].items()):
-            if isinstance(dpi_dict, dict):
-                for dpi, res_list in dpi_dict.items():
-                    if not res_list: continue
-                    corrs = batch_corr_gpu(res_list, scanner_fingerprints, fp_keys) # (N, K)
-                    features.extend(corrs.tolist())
-                    labels.extend([scanner] * len(res_list))
+    fp_bank = FingerprintBank.from_fingerprints(scanner_fingerprints, fp_keys)
+
+    # One shard per scanner/dpi, in store order (train/eval scripts rely on it)
+    print("Computing PRNU features (GPU Batch) ...")
+    for dataset_name, scanner, dpi, res_list, _ in tqdm(list(store.groups(DATASETS))):
+        corrs = batch_corr_gpu(res_list, fp_bank) # (N, K)
+        features.extend(corrs.tolist())
+        labels.extend([scanner] * len(res_list))
 
     # Save features
     with open(FEATURES_OUT, "wb") as f:
@@ -85,18 +111,12 @@ if os.path.exists(RES_PATH):
    
     # Enhanced Features (FFT + LBP + Texture)
     enhanced_features, enhanced_labels = [], []
-    for dataset_name in ["official", "Wikipedia"]:
-        if dataset_name not in residuals_dict: 
-            continue
-            
-        print(f"Extracting enhanced features for {dataset_name} ...")
-        for scanner, dpi_dict in tqdm(residuals_dict[dataset_name].items()):
-            if isinstance(dpi_dict, dict):
-                for dpi, res_list in dpi_dict.items():
-                    for res in res_list:
-                        feat = extract_enhanced_features(res)
-                        enhanced_features.append(feat)
-                        enhanced_labels.append(scanner)
+    print("Extracting enhanced features ...")
+    for dataset_name, scanner, dpi, res_list, _ in tqdm(list(store.groups(DATASETS))):
+        for res in res_list:
+            feat = extract_enhanced_features(np.asarray(res))
+            enhanced_features.append(feat)
+            enhanced_labels.append(scanner)
 
     # Save enhanced features
     with open(ENHANCED_OUT, "wb") as f:
@@ -105,4 +125,4 @@ if os.path.exists(RES_PATH):
     print(f"Saved enhanced features to {ENHANCED_OUT}")
 
 else:
-    print(f" {RES_PATH} not found. Cannot extract features.")
+    print(f" No official/Wikipedia residuals in {STORE_DIR}. Run processing.py first.")
@@ -2,159 +2,267 @@
 processing.py
 Data loading and preprocessing functions.
 - Handles `Flatfield`, `official`, `Wikipedia` datasets.
-- Produces: residual images (256x256x1) and saves them as pickle files.
+- Produces: residual images (256x256) streamed into a sharded, memory-mapped
+  residual store (results/hybrid_cnn/residual_store) with an index.csv manifest.
+- --incremental: residuals are cached by file content hash + parameters,
+  so only new or changed scans are denoised again.
 """
 
 import os
 import pickle
+import argparse
 from tqdm import tqdm
-from utils import process_batch_gpu, USE_GPU
+from functools import partial
+from utils import ResidualPipeline, gpu_available, residual_batch_gpu
+from preprocessing import load_residual_input, ArrayCache, ResidualStoreWriter, import_residual_pickle, RESIDUAL_SIZE
+from preprocessing import map_to_shared, SharedMapper, noise_residual, canonical_denoiser, DENOISERS, DEFAULT_WORKERS
+from preprocessing import write_failures
 
 # Fallback CPU
-import cv2
 import numpy as np
-import pywt
-from scipy.signal import wiener as scipy_wiener
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 # Global Parameters
-IMG_SIZE = (256, 256)
-DENOISE_METHOD = "wavelet"
+IMG_SIZE = RESIDUAL_SIZE
+DENOISE_METHOD = "haar"       # any name in preprocessing.DENOISERS
+TF_DENOISERS = ("haar",)      # denoisers residual_batch_gpu implements (canonical names)
 BATCH_SIZE = 64
-MAX_WORKERS = 8
+MAX_WORKERS = DEFAULT_WORKERS   # CPU residual worker processes
+CPU_CHUNKSIZE = 8               # files per pool task
+USE_GPU = gpu_available()
+CACHE_DIR = "results/hybrid_cnn/residual_cache"
+STORE_DIR = "results/hybrid_cnn/residual_store"
+IMAGE_EXTS = (".tif", ".tiff", ".png", ".jpg", ".jpeg")
+STORE_CHUNK = 512  # files per run_processing call when streaming into the store
+FAILURES_CSV = "results/hybrid_cnn/residual_failures.csv"
+FAILURES = []      # (path, error) of every file left out of this run
 
 print(f"Dataset Processing: Use GPU? {USE_GPU}")
 
-def to_gray(img):
-    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
-
-def resize_to(img, size=IMG_SIZE):
-    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+def preprocess_image_cpu(fpath, method=None):
+    """Process single image on CPU."""
+    img = load_residual_input(fpath, IMG_SIZE)
+    if img is None:
+        raise ValueError(f"Could not read image: {fpath}")
+    # Residual = image - denoised image (denoiser picked by name, see preprocessing/denoisers.py)
+    return noise_residual(img, method or DENOISE_METHOD)
 
-def normalize_img(img):
-    return img.astype(np.float32) / 255.0
+def residual_compute(method):
+    """Batch residual function for the GPU pipeline: TF for Haar, the batched NumPy denoiser otherwise."""
+    if canonical_denoiser(method) in TF_DENOISERS:
+        return residual_batch_gpu
+    return partial(noise_residual, method=method)
 
-def denoise_wavelet_img_cpu(img):
-    """Wavelet denoising (Haar) on CPU using PyWavelets."""
-    coeffs = pywt.dwt2(img, 'haar')
-    cA, (cH, cV, cD) = coeffs
-    cH[:] = 0; cV[:] = 0; cD[:] = 0
-    return pywt.idwt2((cA, (cH, cV, cD)), 'haar')
+def residual_params():
+    """Parameters that change residual values; aliases ("wavelet") share the key of their denoiser."""
+    return {"size": IMG_SIZE, "denoiser": canonical_denoiser(DENOISE_METHOD)}
 
-def preprocess_image_cpu(fpath, method=DENOISE_METHOD):
-    """Process single image on CPU."""
-    img = cv2.imread(fpath, cv2.IMREAD_UNCHANGED)
-    if img is None:
-        return None
-    img = to_gray(img)
-    img = resize_to(img)
-    img = normalize_img(img)
-    # Denoising
-    if method == "wiener":
-        den = scipy_wiener(img, mysize=(5,5))
-    elif method == "wavelet":
-        den = denoise_wavelet_img_cpu(img)
-    else:
-        raise ValueError(f"Unknown denoise method: {method}")
-    
-    # Residual
-    res = (img - den).astype(np.float32)
-    return res
+_PIPELINES = {}
 
-def process_folder(base_dir, use_dpi_subfolders=True):
+def residual_pipeline(method=None):
     """
-    Process all images under a folder.
-    Returns nested dict: residuals[scanner][dpi] = list_of_residuals
+    ResidualPipeline computing residuals with method, one per denoiser; kept apart from
+    utils.get_pipeline(), whose Haar compute test.py and the dashboard rely on.
     """
-    residuals_dict = {}
-    if not os.path.exists(base_dir):
-        print(f"Error: {base_dir} does not exist!")
-        return {}
-
-    scanners = sorted(os.listdir(base_dir))
+    method = canonical_denoiser(method or DENOISE_METHOD)
+    if method not in _PIPELINES:
+        _PIPELINES[method] = ResidualPipeline(compute=residual_compute(method))
+    return _PIPELINES[method]
 
-    for scanner in tqdm(scanners, desc="Scanners"):
+def iter_folder_files(base_dir, use_dpi_subfolders=True):
+    """Yield (scanner, dpi, files) per leaf folder in sorted order; dpi is None without dpi subfolders."""
+    for scanner in sorted(os.listdir(base_dir)):
         scanner_dir = os.path.join(base_dir, scanner)
         if not os.path.isdir(scanner_dir):
             continue
-
-        residuals_dict[scanner] = {}
-
         if use_dpi_subfolders:
-            for dpi in os.listdir(scanner_dir):
+            for dpi in sorted(os.listdir(scanner_dir)):
                 dpi_dir = os.path.join(scanner_dir, dpi)
                 if not os.path.isdir(dpi_dir):
                     continue
-                files = [os.path.join(dpi_dir, f) for f in os.listdir(dpi_dir)
-                         if f.lower().endswith((".tif", ".tiff", ".png", ".jpg", ".jpeg"))]
-                
-                # Process files
-                residuals_dict[scanner][dpi] = run_processing(files)
+                files = [os.path.join(dpi_dir, f) for f in sorted(os.listdir(dpi_dir))
+                         if f.lower().endswith(IMAGE_EXTS)]
+                yield scanner, dpi, files
         else:
             # Flatfield dataset: no dpi subfolders
-            files = [os.path.join(scanner_dir, f) for f in os.listdir(scanner_dir)
-                     if f.lower().endswith((".tif", ".tiff", ".png", ".jpg", ".jpeg"))]
-            residuals_dict[scanner] = run_processing(files)
+            files = [os.path.join(scanner_dir, f) for f in sorted(os.listdir(scanner_dir))
+                     if f.lower().endswith(IMAGE_EXTS)]
+            yield scanner, None, files
+
+def process_folder(base_dir, use_dpi_subfolders=True, cache=None):
+    """
+    Process all images under a folder.
+    Returns nested dict: residuals[scanner][dpi] = list_of_residuals
+    (everything in memory; prefer write_folder_residuals for full datasets)
+    """
+    residuals_dict = {}
+    if not os.path.exists(base_dir):
+        print(f"Error: {base_dir} does not exist!")
+        return {}
+
+    for scanner, dpi, files in tqdm(list(iter_folder_files(base_dir, use_dpi_subfolders)), desc="Folders"):
+        residuals = list(run_processing(files, cache).values())
+        if dpi is None:
+            residuals_dict[scanner] = residuals
+        else:
+            residuals_dict.setdefault(scanner, {})[dpi] = residuals
 
     return residuals_dict
 
-def run_processing(file_list):
-    """Dispatches to GPU batch or CPU pool."""
-    if not file_list:
-        return []
-        
-    all_residuals = []
+def cpu_mapper():
+    """SharedMapper for the CPU path: one worker pool and a STORE_CHUNK-row shared buffer per run."""
+    return SharedMapper(partial(preprocess_image_cpu, method=DENOISE_METHOD), IMG_SIZE, STORE_CHUNK, np.float32,
+                        workers=MAX_WORKERS, chunksize=CPU_CHUNKSIZE)
+
+def write_folder_residuals(writer, dataset, base_dir, use_dpi_subfolders=True, cache=None, mapper=None):
+    """
+    Stream residuals of every image under base_dir into a ResidualStoreWriter; returns the count.
+    mapper: SharedMapper reused for every chunk on the CPU path (default: one per call).
+    """
+    if not os.path.exists(base_dir):
+        print(f"Error: {base_dir} does not exist!")
+        return 0
+
+    own_mapper = mapper is None and not USE_GPU
+    if own_mapper:
+        mapper = cpu_mapper()
+    count = 0
+    try:
+        for scanner, dpi, files in tqdm(list(iter_folder_files(base_dir, use_dpi_subfolders)), desc=dataset):
+            # Chunked so only STORE_CHUNK residuals are in memory at a time
+            for i in range(0, len(files), STORE_CHUNK):
+                for path, res in run_processing(files[i:i + STORE_CHUNK], cache, mapper).items():
+                    writer.add_residual(dataset, scanner, dpi, path, res)
+                    count += 1
+    finally:
+        if own_mapper:
+            mapper.close()
+    return count
+
+def compute_residuals(file_list, mapper=None):
+    """
+    Residuals for file_list as {path: residual}, in input order; files that fail are left
+    out, reported and recorded as (path, error) in FAILURES.
+    mapper: SharedMapper for the CPU path (default: a one-shot pool for this call).
+    """
+    results = {}
+    failures = []
     
     if USE_GPU:
-        # Batch chunks
-        for i in range(0, len(file_list), BATCH_SIZE):
-            chunk = file_list[i : i + BATCH_SIZE]
-            res_chunk = process_batch_gpu(chunk)
-            all_residuals.extend(res_chunk)
+        # Batch chunks; the pipeline decodes the next chunk while this one is on the GPU
+        pipeline = residual_pipeline()
+        for chunk, valid, residuals in pipeline.iter_batches(file_list, BATCH_SIZE):
+            ok = set(valid)
+            failures.extend((f, "Could not read image") for j, f in enumerate(chunk) if j not in ok)
+            if residuals is None:
+                continue
+            for j, res in zip(valid, residuals):
+                results[chunk[j]] = res
     else:
-        # Fallback to ThreadPoolExecutor
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = [executor.submit(preprocess_image_cpu, f) for f in file_list]
-            for fut in as_completed(futures):
-                res = fut.result()
-                if res is not None:
-                    all_residuals.append(res)
-                    
-    return all_residuals
-
-def save_pickle(obj, path):
-    # Ensure dir exists
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "wb") as f:
-        pickle.dump(obj, f)
-    print(f"Saved residuals to {path}")
+        # CPU: process pool writing residuals straight into shared memory, in input order
+        if mapper is not None:
+            out, ok, failures = mapper.map(file_list, return_errors=True)
+        else:
+            out, ok, failures = map_to_shared(partial(preprocess_image_cpu, method=DENOISE_METHOD), file_list,
+                                              IMG_SIZE, np.float32, workers=MAX_WORKERS, chunksize=CPU_CHUNKSIZE,
+                                              return_errors=True)
+        results = {f: out[i] for i, f in enumerate(file_list) if ok[i]}
+
+    for path, error in failures:
+        print(f" Failed to process {path}: {error}")
+    FAILURES.extend(failures)
+    return results
+
+def run_processing(file_list, cache=None, mapper=None):
+    """
+    Dispatches to GPU batch or CPU pool; with a cache, only uncached files are processed.
+    Returns {path: residual} in input order; unreadable files are left out.
+    """
+    if not file_list:
+        return {}
+
+    if cache is None:
+        return compute_residuals(file_list, mapper)
+
+    residuals = {}
+    miss_hashes = {}
+    for f in file_list:
+        res, content_hash = cache.lookup(f)
+        if res is None:
+            miss_hashes[f] = content_hash  # each file is hashed once, even on a miss
+        else:
+            residuals[f] = res
+
+    for f, res in compute_residuals(list(miss_hashes), mapper).items():
+        cache.put(f, res, content_hash=miss_hashes[f])
+        residuals[f] = res
+
+    return {f: residuals[f] for f in file_list if f in residuals}
+
+def import_legacy_pickles(res_path, flatfield_path, store_dir=STORE_DIR):
+    """Convert old official_wiki_residuals.pkl / flatfield_residuals.pkl into a residual store."""
+    with ResidualStoreWriter(store_dir, size=IMG_SIZE[0]) as writer:
+        with open(res_path, "rb") as f:
+            import_residual_pickle(pickle.load(f), writer)
+        if os.path.exists(flatfield_path):
+            with open(flatfield_path, "rb") as f:
+                import_residual_pickle(pickle.load(f), writer, dataset="Flatfield")
+    print(f"Imported {res_path} (+ flatfield) into {store_dir}")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Extract hybrid CNN residuals for Official/Wikipedia/Flatfield.")
+    p.add_argument("--incremental", "-i", action="store_true",
+                   help=f"Reuse residuals cached in {CACHE_DIR}; only new/changed scans are processed.")
+    p.add_argument("--workers", "-w", type=int, default=MAX_WORKERS,
+                   help="CPU worker processes for residual extraction (CPU path only).")
+    p.add_argument("--denoiser", choices=sorted(DENOISERS), default=DENOISE_METHOD,
+                   help="Residual denoiser; only haar runs in TensorFlow, others use the batched NumPy versions.")
+    p.add_argument("--import-pickles", action="store_true",
+                   help="Convert existing official_wiki_residuals.pkl / flatfield_residuals.pkl instead of reprocessing.")
+    return p.parse_args()
 
 
 # Main Execution
 if __name__ == "__main__":
+    args = parse_args()
+    MAX_WORKERS = args.workers
+    DENOISE_METHOD = args.denoiser
     BASE_DIR = "data"
+    if args.import_pickles:
+        import_legacy_pickles("results/hybrid_cnn/official_wiki_residuals.pkl",
+                              "results/hybrid_cnn/flatfield_residuals.pkl")
+        raise SystemExit(0)
 
-    # Official + Wikipedia
-    datasets = ["official", "Wikipedia"]
-    official_wiki_residuals = {}
-
-    for dataset in datasets:
-        print(f"\nProcessing {dataset} dataset...")
-        dataset_dir = os.path.join(BASE_DIR, dataset)
-        official_wiki_residuals[dataset] = process_folder(dataset_dir, use_dpi_subfolders=True)
+    cache = ArrayCache(CACHE_DIR, residual_params()) if args.incremental else None
 
-    OUT_PATH = os.path.join(BASE_DIR, "../results/hybrid_cnn/official_wiki_residuals.pkl")
-    save_pickle(official_wiki_residuals, OUT_PATH)
+    # Official + Wikipedia + Flatfield, all streamed into one residual store
+    counts = {}
+    # CPU path: one worker pool + shared buffer for every chunk of every dataset
+    mapper = None if USE_GPU else cpu_mapper()
+    try:
+        with ResidualStoreWriter(STORE_DIR, size=IMG_SIZE[0]) as writer:
+            for dataset in ["official", "Wikipedia"]:
+                print(f"\nProcessing {dataset} dataset...")
+                dataset_dir = os.path.join(BASE_DIR, dataset)
+                counts[dataset] = write_folder_residuals(writer, dataset, dataset_dir, use_dpi_subfolders=True,
+                                                         cache=cache, mapper=mapper)
 
-    # Flatfield dataset (no dpi subfolders)
-    print("\nProcessing Flatfield dataset...")
-    flatfield_dir = os.path.join(BASE_DIR, "Flatfield")
-    flatfield_residuals = process_folder(flatfield_dir, use_dpi_subfolders=False)
-    OUT_PATH_FLAT = os.path.join(flatfield_dir, "../../results/hybrid_cnn/flatfield_residuals.pkl")
-    save_pickle(flatfield_residuals, OUT_PATH_FLAT)
+            # Flatfield dataset (no dpi subfolders)
+            print("\nProcessing Flatfield dataset...")
+            flatfield_dir = os.path.join(BASE_DIR, "Flatfield")
+            counts["Flatfield"] = write_folder_residuals(writer, "Flatfield", flatfield_dir, use_dpi_subfolders=False,
+                                                         cache=cache, mapper=mapper)
+    finally:
+        if mapper is not None:
+            mapper.close()
 
     # Summary
-    total_scanners = len(flatfield_residuals)
-    total_images = sum([len(v) for v in flatfield_residuals.values() if isinstance(v, list)])
-    print(f"\nDone. Flatfield: {total_scanners} scanners, ~{total_images} images processed.")
+    print(f"\nDone. Residuals written to {STORE_DIR}: " + ", ".join(f"{k} {v}" for k, v in counts.items()))
+    if FAILURES:
+        write_failures(FAILURES, FAILURES_CSV)
+    if cache is not None:
+        cache.save()
+        print(f"Residual cache: {cache.hits} reused, {cache.misses} computed ({CACHE_DIR})")
+    if USE_GPU:
+        print(f"Residual pipeline: {residual_pipeline().report()}")
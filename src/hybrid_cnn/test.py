@@ -6,13 +6,15 @@ import tensorflow as tf
 import cv2
 import csv
 import argparse
-from utils import process_batch_gpu, batch_corr_gpu, extract_enhanced_features, to_gray, resize_to, normalize_img
+from utils import process_batch_gpu, batch_corr_gpu, extract_enhanced_features, to_gray, resize_to, normalize_img, get_pipeline
+from preprocessing import load_bank, BANK_FILE
 
 # Paths
 BASE_DIR = "data"
 ART_DIR = "results/hybrid_cnn"
 FP_PATH = os.path.join(ART_DIR, "scanner_fingerprints.pkl")
 ORDER_NPY = os.path.join(ART_DIR, "fp_keys.npy")
+BANK_PATH = os.path.join(ART_DIR, BANK_FILE)
 CKPT_PATH = os.path.join(ART_DIR, "scanner_hybrid_final.keras")
 ENCODER_PATH = os.path.join(ART_DIR, "hybrid_label_encoder.pkl")
 SCALER_PATH = os.path.join(ART_DIR, "hybrid_feat_scaler.pkl")
@@ -30,25 +32,25 @@ with open(ENCODER_PATH, "rb") as f:
 with open(SCALER_PATH, "rb") as f:
     scaler_inf = pickle.load(f)
 
-with open(FP_PATH, "rb") as f:
-    scanner_fps_inf = pickle.load(f)
-
-fp_keys_inf = np.load(ORDER_NPY, allow_pickle=True).tolist()
+# Normalised fingerprint matrix (built from scanner_fingerprints.pkl if the bank was not saved)
+fp_bank_inf = load_bank(BANK_PATH, FP_PATH, np.load(ORDER_NPY, allow_pickle=True).tolist())
 
 def predict_batch(image_paths):
     """
     Predict a batch of images using GPU acceleration.
     """
-    # 1. Preprocess Batch (Residuals)
-    residuals = process_batch_gpu(image_paths) 
-    
-    if not residuals:
+    # 1. Preprocess Batch (Residuals), aligned with the files they came from
+    batch = process_batch_gpu(image_paths)
+    for path in batch.failed:
+        print(f"{path} -> skipped (unreadable)")
+
+    if not len(batch):
         return []
         
-    residuals = np.array(residuals, dtype=np.float32) # (B, 256, 256)
+    residuals = batch.residuals # (B, 256, 256)
     
     # 2. Extract Features
-    corrs = batch_corr_gpu(residuals, scanner_fps_inf, fp_keys_inf) # (B, K)
+    corrs = batch_corr_gpu(residuals, fp_bank_inf) # (B, K)
     
     enh_feats = []
     for res in residuals:
@@ -69,7 +71,7 @@ def predict_batch(image_paths):
         idx = int(np.argmax(prob))
         label = le_inf.classes_[idx]
         conf = float(prob[idx] * 100)
-        results.append((image_paths[i], label, conf))
+        results.append((batch.paths[i], label, conf))
         
     return results
 
@@ -97,6 +99,7 @@ def predict_folder(folder_path, output_csv="results.csv", exts=("*.tif","*.png",
         writer.writerow(["Image", "Predicted_Label", "Confidence(%)"])
         writer.writerows(all_results)
     print(f"\n Predictions saved to {output_csv}")
+    print(f" Residual pipeline: {get_pipeline().report()}")
     return all_results
 
 def parse_args():
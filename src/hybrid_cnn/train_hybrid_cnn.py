@@ -9,12 +9,14 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from tensorflow.keras.utils import to_categorical
 
-from utils import corr2d, extract_enhanced_features
+from utils import extract_enhanced_features
 from model import build_hybrid_model
+from preprocessing import ResidualStore, FingerprintBank
 
 # ---- Local Paths ----
 BASE_DIR = "data"
-RES_PATH  = os.path.join(BASE_DIR, "../results/hybrid_cnn/official_wiki_residuals.pkl")
+STORE_DIR = os.path.join(BASE_DIR, "../results/hybrid_cnn/residual_store")
+DATASETS  = ["official", "Wikipedia"]
 FP_PATH   = os.path.join(BASE_DIR, "../results/hybrid_cnn/scanner_fingerprints.pkl")
 ORDER_NPY = os.path.join(BASE_DIR, "../results/hybrid_cnn/fp_keys.npy")
 FEATURES_PATH = os.path.join(BASE_DIR, "../results/hybrid_cnn/features.pkl")
@@ -36,9 +38,11 @@ print("Using device:", device_name)
 
 
 # Load & Prepare Data
-print("Loading residuals...")
-with open(RES_PATH, "rb") as f:
-    residuals_dict = pickle.load(f)
+# Residuals stay in the memory-mapped store; only labels / features are held in RAM
+print("Opening residual store...")
+store = ResidualStore(STORE_DIR)
+rec_idx = store.select(DATASETS)      # record ids, in the order features.pkl was built
+y = store.labels[rec_idx]
 
 # Optional: Load pre-computed features
 precomputed = False
@@ -60,39 +64,22 @@ else:
     else:
         raise FileNotFoundError("Scanner fingerprints not found. Run feature_extrac.py first.")
 
-X_img, X_feat, y = [], [], []
-idx_counter = 0
+X_feat = []
+if precomputed:
+    X_feat = [f_p + f_e for f_p, f_e in zip(feats_prnu, feats_enh)]
+else:
+    fp_bank = FingerprintBank.from_fingerprints(scanner_fps, fp_keys)
+    for _, batch in store.iter_batches(rec_idx):
+        # One GEMM per batch for the PRNU correlations
+        corrs = fp_bank.correlate(batch).tolist()
+        for res, v_corr in zip(batch, corrs):
+            v_enh = extract_enhanced_features(res)
+            X_feat.append(v_corr + v_enh)
 
-for dataset_name in ["official", "Wikipedia"]:
-    if dataset_name not in residuals_dict:
-        continue
-    
-    print(f"Processing {dataset_name}...")
-    for scanner, dpi_dict in residuals_dict[dataset_name].items():
-        if isinstance(dpi_dict, dict):
-             for dpi, res_list in dpi_dict.items():
-                for res in res_list:
-                    # Image Input (256, 256, 1)
-                    X_img.append(np.expand_dims(res, -1))
-                    
-                    # Feature Input
-                    if precomputed:
-                        f_p = feats_prnu[idx_counter]
-                        f_e = feats_enh[idx_counter]
-                        X_feat.append(f_p + f_e)
-                    else:
-                        v_corr = [corr2d(res, scanner_fps[k]) for k in fp_keys]
-                        v_enh = extract_enhanced_features(res)
-                        X_feat.append(v_corr + v_enh)
-                    
-                    y.append(scanner)
-                    idx_counter += 1
-
-X_img = np.array(X_img, dtype=np.float32)
 X_feat = np.array(X_feat, dtype=np.float32)
-y = np.array(y)
+IMG_SHAPE = (store.patch_size, store.patch_size, 1)
 
-print(f"Dataset Shape: Images {X_img.shape}, Features {X_feat.shape}, Labels {y.shape}")
+print(f"Dataset Shape: Images {(len(rec_idx),) + IMG_SHAPE}, Features {X_feat.shape}, Labels {y.shape}")
 
 # Encode Labels
 le = LabelEncoder()
@@ -100,15 +87,16 @@ y_int = le.fit_transform(y)
 num_classes = len(le.classes_)
 y_cat = to_categorical(y_int, num_classes)
 
-# Train/Test Split
-X_img_tr, X_img_te, X_feat_tr, X_feat_te, y_tr, y_te = train_test_split(
-    X_img, X_feat, y_cat, test_size=0.2, random_state=SEED, stratify=y_int
+# Train/Test Split (on positions; same split as splitting the full arrays)
+pos_tr, pos_te = train_test_split(
+    np.arange(len(rec_idx)), test_size=0.2, random_state=SEED, stratify=y_int
 )
+y_tr, y_te = y_cat[pos_tr], y_cat[pos_te]
 
 # Normalize Features
 scaler = StandardScaler()
-X_feat_tr = scaler.fit_transform(X_feat_tr)
-X_feat_te = scaler.transform(X_feat_te)
+X_feat_tr = scaler.fit_transform(X_feat[pos_tr])
+X_feat_te = scaler.transform(X_feat[pos_te])
 
 # Save Preprocessors
 with open(os.path.join(ART_DIR, "hybrid_label_encoder.pkl"), "wb") as f:
@@ -116,10 +104,23 @@ with open(os.path.join(ART_DIR, "hybrid_label_encoder.pkl"), "wb") as f:
 with open(os.path.join(ART_DIR, "hybrid_feat_scaler.pkl"), "wb") as f:
     pickle.dump(scaler, f)
 
+def store_dataset(positions, feats, labels, shuffle):
+    """tf.data pipeline that reads residuals from the memmap store on demand."""
+    def gen():
+        order = np.random.permutation(len(positions)) if shuffle else np.arange(len(positions))
+        for k in order:
+            res = store.get(rec_idx[positions[k]])
+            yield (np.expand_dims(res, -1), feats[k]), labels[k]
+    signature = (
+        (tf.TensorSpec(IMG_SHAPE, tf.float32), tf.TensorSpec((feats.shape[1],), tf.float32)),
+        tf.TensorSpec((labels.shape[1],), tf.float32),
+    )
+    return tf.data.Dataset.from_generator(gen, output_signature=signature)
+
 # Build & Train Model
 with tf.device(device_name):
     model = build_hybrid_model(
-        img_shape=(256, 256, 1), 
+        img_shape=IMG_SHAPE, 
         feat_shape=(X_feat.shape[1],), 
         num_classes=num_classes
     )
@@ -130,9 +131,10 @@ with tf.device(device_name):
 
     # Data Pipeline
     BATCH = 32
-    train_ds = tf.data.Dataset.from_tensor_slices(((X_img_tr, X_feat_tr), y_tr))\
-        .shuffle(len(y_tr)).batch(BATCH).prefetch(tf.data.AUTOTUNE)
-    val_ds = tf.data.Dataset.from_tensor_slices(((X_img_te, X_feat_te), y_te))\
+    # Reshuffled every epoch by the generator, like .shuffle(len(y_tr))
+    train_ds = store_dataset(pos_tr, X_feat_tr.astype(np.float32), y_tr.astype(np.float32), shuffle=True)\
+        .batch(BATCH).prefetch(tf.data.AUTOTUNE)
+    val_ds = store_dataset(pos_te, X_feat_te.astype(np.float32), y_te.astype(np.float32), shuffle=False)\
         .batch(BATCH).prefetch(tf.data.AUTOTUNE)
 
     # Callbacks
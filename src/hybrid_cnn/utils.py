@@ -1,13 +1,30 @@
+import os
+import sys
+import time
 import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 # import tensorflow as tf  <-- Removed for lazy loading
-import cv2
 from skimage.feature import local_binary_pattern as sk_lbp
 from scipy.fft import fft2, fftshift
 from scipy import ndimage
 
+# Make src/ importable when run as a script from src/hybrid_cnn
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
+
+from preprocessing import to_gray, resize_to, normalize_img, load_residual_input, RESIDUAL_SIZE
+from preprocessing import FingerprintBank
+
 # GPU check moved to functions to avoid top-level TF import
-# gpus = tf.config.list_physical_devices('GPU')
-# USE_GPU = len(gpus) > 0
+def gpu_available():
+    """True if TensorFlow is installed and sees at least one GPU."""
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return False
+    return len(tf.config.list_physical_devices('GPU')) > 0
 
 def corr2d(a, b):
     """
@@ -20,14 +37,28 @@ def corr2d(a, b):
     denom = (np.linalg.norm(a) * np.linalg.norm(b))
     return float((a @ b) / denom) if denom != 0 else 0.0
 
-def batch_corr_gpu(residuals, fingerprints, fp_keys):
+def as_fingerprint_bank(fingerprints, fp_keys=None):
+    """
+    FingerprintBank for a fingerprint dict + key order (a bank is returned as is).
+    Building from a dict normalises every fingerprint, so callers correlating many
+    batches should build the bank once and pass it instead.
+    """
+    if isinstance(fingerprints, FingerprintBank):
+        return fingerprints
+    return FingerprintBank.from_fingerprints(fingerprints, fp_keys)
+
+def batch_corr_gpu(residuals, fingerprints, fp_keys=None, backend=None):
     """
-    Compute normalised cross-correlation for a batch of residuals against all fingerprints using GPU.
+    Compute normalised cross-correlation for a batch of residuals against all fingerprints.
+    One (N, D) x (D, K) GEMM: NumPy/BLAS on CPU hosts, TF / torch only when a GPU is
+    visible (preprocessing.correlation.resolve_backend); TF is not imported otherwise.
     
     Args:
         residuals: list or array of shape (N, H, W) or (N, H, W, 1)
-        fingerprints: dict of scanner -> fingerprint (H, W) or (H, W, 1)
-        fp_keys: list of keys to ensure order
+        fingerprints: FingerprintBank (preferred; reused across batches) or a dict of
+            scanner -> fingerprint (H, W) or (H, W, 1), normalised on every call
+        fp_keys: list of keys to ensure order (ignored for a FingerprintBank)
+        backend: "auto" / "numpy" / "tf" / "torch" (default: CORR_BACKEND)
         
     Returns:
         corrs: shape (N, K) where K is number of fingerprints
@@ -35,45 +66,15 @@ def batch_corr_gpu(residuals, fingerprints, fp_keys):
     if len(residuals) == 0:
         return []
         
-    # Prepare Fingerprints Matrix (K, D) where D = H*W
-    fp_matrix = []
-    for k in fp_keys:
-        fp = fingerprints[k].astype(np.float32).ravel()
-        # Normalize (zero mean)
-        fp -= fp.mean()
-        # Unit norm (so dot product == correlation)
-        norm = np.linalg.norm(fp)
-        if norm > 0:
-            fp /= norm
-        fp_matrix.append(fp)
-    
-    fp_matrix = np.array(fp_matrix).T # (D, K)
-    
-    # Prepare Residuals Matrix (N, D)
-    res_matrix = []
-    for r in residuals:
-        r_flat = r.astype(np.float32).ravel()
-        r_flat -= r_flat.mean()
-        norm = np.linalg.norm(r_flat)
-        if norm > 0:
-            r_flat /= norm
-        res_matrix.append(r_flat)
-    
-    res_matrix = np.array(res_matrix)
-    
-    # Lazy import TF
-    import tensorflow as tf
-    gpus = tf.config.list_physical_devices('GPU')
-    USE_GPU = len(gpus) > 0
-    
-    # GPU Matmul
-    with tf.device('/GPU:0' if USE_GPU else '/CPU:0'):
-        # A (N, D) . B (D, K) -> (N, K)
-        A = tf.convert_to_tensor(res_matrix, dtype=tf.float32)
-        B = tf.convert_to_tensor(fp_matrix, dtype=tf.float32)
-        C = tf.matmul(A, B)
-        
-    return C.numpy()
+    return as_fingerprint_bank(fingerprints, fp_keys).correlate(residuals, backend)
+
+def batch_pce(residuals, fingerprints, fp_keys=None, return_shifts=False):
+    """
+    PCE of (N, h, w) residuals against all fingerprints over every shift -> (N, K);
+    tolerates shifted and cropped (h, w <= fingerprint size) questioned scans.
+    See FingerprintBank.pce.
+    """
+    return as_fingerprint_bank(fingerprints, fp_keys).pce(residuals, return_shifts=return_shifts)
 
 def fft_radial_energy(img, K=6):
     """
@@ -135,57 +136,185 @@ def extract_enhanced_features(residual):
 
     return [float(low_freq), float(mid_freq), float(high_freq)] + lbp_hist.tolist() + texture_features
 
-# ---- GPU Preprocessing Helpers ----
-
-def to_gray(img):
-    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+# ---- GPU Preprocessing ----
 
-def resize_to(img, size=(256, 256)):
-    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+PIPELINE_BATCH = 16     # images per residual compute call when streaming (iter_batches)
+PREFETCH_BATCHES = 2    # decoded batches in flight (bounded queue depth)
+DECODE_WORKERS = 4      # reader threads
 
-def normalize_img(img):
-    return img.astype(np.float32) / 255.0
-
-def process_batch_gpu(file_paths):
+def load_batch(file_paths):
     """
-    Process a batch of file paths on GPU using TensorFlow.
-    Approximates Haar Wavelet Denoising (Level 1).
+    Decode files into a (B, H, W) float32 batch.
+    Returns (batch, valid_indices); unreadable files are skipped, batch is None if none load.
     """
     imgs = []
     valid_indices = []
     
     for idx, fpath in enumerate(file_paths):
-        img = cv2.imread(fpath, cv2.IMREAD_UNCHANGED)
+        img = load_residual_input(fpath)
         if img is None: 
             continue
-        img = to_gray(img)
-        img = resize_to(img)
-        img = normalize_img(img)
         imgs.append(img)
         valid_indices.append(idx)
         
     if not imgs:
-        return []
+        return None, []
+    return np.array(imgs, dtype=np.float32), valid_indices
 
-    batch_np = np.array(imgs, dtype=np.float32)
-    batch_np = np.expand_dims(batch_np, -1)
-    
+def residual_batch_gpu(batch_np):
+    """
+    Level-1 Haar residuals of a (B, H, W) batch using TensorFlow.
+    Same block-mean formulation as preprocessing.haar_denoise, so GPU and
+    CPU residuals agree to float32 rounding. Returns (B, H, W) residuals.
+    """
     import tensorflow as tf
     gpus = tf.config.list_physical_devices('GPU')
     USE_GPU = len(gpus) > 0
 
+    b, h, w = batch_np.shape
+    ph, pw = h % 2, w % 2
+    if ph or pw:
+        # Edge padding = pywt symmetric mode for the Haar filter
+        batch_np = np.pad(batch_np, [(0, 0), (0, ph), (0, pw)], mode="edge")
+    H, W = batch_np.shape[1:]
+
     with tf.device('/GPU:0' if USE_GPU else '/CPU:0'):
-        x = tf.convert_to_tensor(batch_np)
+        x = tf.convert_to_tensor(batch_np, dtype=tf.float32)
         
-        # Haar Approximation (L1)
-        pooled = tf.nn.avg_pool2d(x, ksize=2, strides=2, padding='VALID')
-        denoised = tf.image.resize(pooled, (256, 256), method=tf.image.ResizeMethod.NEAREST_NEIGHBOR)
+        # Haar L1 with zeroed details: every 2x2 block -> its mean
+        blocks = tf.reshape(x, [b, H // 2, 2, W // 2, 2])
+        approx = tf.reduce_mean(blocks, axis=[2, 4], keepdims=True)
+        denoised = tf.reshape(tf.broadcast_to(approx, tf.shape(blocks)), [b, H, W])
         residual = x - denoised
         
-    res_np = residual.numpy()
-    
-    results = []
-    for i in range(len(res_np)):
-        results.append(res_np[i].squeeze())
-        
-    return results
+    return residual.numpy()[:, :h, :w]
+
+class ResidualPipeline:
+    """
+    Overlaps decode with residual compute for batched residual extraction.
+
+    A thread pool decodes / grays / resizes / normalises the files of the
+    next batches (cv2 releases the GIL) while the current batch is being
+    denoised. At most `prefetch` batches are in flight, bounding memory.
+    Per-stage counters accumulate in .stats:
+        decode_s   summed per-image decode time across reader threads
+        wait_s     time the compute stage sat waiting for decoded batches
+        compute_s  time spent in the residual compute function
+        images / failed / batches
+    """
+
+    def __init__(self, decode_workers=DECODE_WORKERS, prefetch=PREFETCH_BATCHES, compute=None):
+        self.decode_workers = decode_workers
+        self.prefetch = max(1, prefetch)
+        self.compute = compute or residual_batch_gpu
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"decode_s": 0.0, "wait_s": 0.0, "compute_s": 0.0, "images": 0, "failed": 0, "batches": 0}
+
+    @staticmethod
+    def _decode(fpath):
+        t0 = time.perf_counter()
+        img = load_residual_input(fpath)
+        return img, time.perf_counter() - t0
+
+    def iter_batches(self, file_paths, batch_size=PIPELINE_BATCH):
+        """
+        Yield (chunk_paths, valid_indices, residuals) per batch, in input order;
+        residuals is (len(valid_indices), H, W) or None if nothing in the chunk decoded.
+        """
+        chunks = [file_paths[i:i + batch_size] for i in range(0, len(file_paths), batch_size)]
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.decode_workers) as pool:
+            next_chunk = 0
+            while next_chunk < len(chunks) or pending:
+                # Keep the decode queue topped up to `prefetch` batches
+                while next_chunk < len(chunks) and len(pending) < self.prefetch:
+                    chunk = chunks[next_chunk]
+                    pending.append((chunk, [pool.submit(self._decode, f) for f in chunk]))
+                    next_chunk += 1
+
+                chunk, futures = pending.popleft()
+                t0 = time.perf_counter()
+                decoded = [fut.result() for fut in futures]
+                self.stats["wait_s"] += time.perf_counter() - t0
+
+                imgs, valid = [], []
+                for idx, (img, dt) in enumerate(decoded):
+                    self.stats["decode_s"] += dt
+                    if img is not None:
+                        imgs.append(img)
+                        valid.append(idx)
+                self.stats["images"] += len(chunk)
+                self.stats["failed"] += len(chunk) - len(valid)
+                self.stats["batches"] += 1
+
+                residuals = None
+                if imgs:
+                    t0 = time.perf_counter()
+                    residuals = self.compute(np.array(imgs, dtype=np.float32))
+                    self.stats["compute_s"] += time.perf_counter() - t0
+                yield chunk, valid, residuals
+
+    def report(self):
+        st = self.stats
+        return (f"{st['images']} images in {st['batches']} batches ({st['failed']} failed) | "
+                f"decode {st['decode_s']:.2f}s, wait {st['wait_s']:.2f}s, compute {st['compute_s']:.2f}s")
+
+
+_PIPELINE = None
+
+
+def get_pipeline():
+    """Shared ResidualPipeline used by process_batch_gpu (stats accumulate across calls)."""
+    global _PIPELINE
+    if _PIPELINE is None:
+        _PIPELINE = ResidualPipeline()
+    return _PIPELINE
+
+
+class ResidualBatch:
+    """
+    Residuals of one process_batch_gpu call, aligned with their files.
+    paths[i] is the source of residuals[i]; files that could not be read
+    are listed in failed (in input order) instead of shifting later results.
+    Iterating yields (path, residual) records.
+    """
+
+    def __init__(self, paths, residuals, failed):
+        self.paths = paths
+        self.residuals = residuals
+        self.failed = failed
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        return zip(self.paths, self.residuals)
+
+
+def process_batch_gpu(file_paths, batch_size=None, pipeline=None):
+    """
+    Process a batch of file paths on GPU using TensorFlow.
+    Level-1 Haar residuals, identical to the CPU preprocessing.haar_denoise
+    (same block-mean formulation; matches pywt to float32 rounding).
+    The caller's batch is one residual compute call (files are still decoded
+    on DECODE_WORKERS threads); with batch_size it is split into sub-batches
+    and decoding of the next one overlaps compute of the current one.
+
+    Returns:
+        ResidualBatch: .paths / .residuals (N, H, W) aligned, .failed unreadable paths
+    """
+    pipeline = pipeline or get_pipeline()
+    paths, parts, failed = [], [], []
+    for chunk, valid, residuals in pipeline.iter_batches(file_paths, batch_size or max(1, len(file_paths))):
+        ok = set(valid)
+        failed.extend(f for j, f in enumerate(chunk) if j not in ok)
+        if residuals is not None:
+            paths.extend(chunk[j] for j in valid)
+            parts.append(residuals)
+    if parts:
+        residuals = np.concatenate(parts).astype(np.float32, copy=False)
+    else:
+        residuals = np.empty((0,) + tuple(RESIDUAL_SIZE), dtype=np.float32)
+    return ResidualBatch(paths, residuals, failed)
@@ -28,7 +28,8 @@ if parent_dir not in sys.path:
 # import tensorflow as tf  <-- Lazy loaded
 import pickle
 import joblib
-from baseline.predict_baseline import predict_scanner as predict_baseline
+from baseline.predict_baseline import get_predictor
+from preprocessing import FingerprintBank, BANK_FILE
 # from hybrid_cnn.utils import ... <-- Lazy loaded
 
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -110,15 +111,21 @@ def get_hybrid_resources():
         with open(scaler_path, "rb") as f: scaler = pickle.load(f)
         with open(fps_path, "rb") as f: fps = pickle.load(f)
         
-        # Fallback for keys if file doesn't exist
-        if os.path.exists(keys_path):
-            with open(keys_path, "rb") as f: keys = pickle.load(f)
+        # Saved bank carries the training key order; otherwise fall back to the keys file / dict order
+        bank_path = os.path.join(base_path, BANK_FILE)
+        if os.path.exists(bank_path):
+            bank = FingerprintBank.load(bank_path)
+            keys = bank.keys
         else:
-            keys = list(fps.keys())
+            if os.path.exists(keys_path):
+                with open(keys_path, "rb") as f: keys = pickle.load(f)
+            else:
+                keys = list(fps.keys())
+            bank = FingerprintBank.from_fingerprints(fps, keys)
         
         return {
             "model": model, "le": le, "scaler": scaler,
-            "fps": fps, "fp_keys": keys
+            "fps": fps, "fp_keys": keys, "fp_bank": bank
         }
     except Exception as e:
         st.error(f"Failed to load Hybrid CNN resources: {e}")
@@ -128,6 +135,13 @@ def load_hybrid_resources():
     return get_hybrid_resources()
 
 
+@st.cache_resource
+def get_baseline_predictor(model_choice="rf"):
+    # Artifacts are loaded once per server process, not once per file.
+    # Missing models raise (exceptions are not cached), so models trained later are picked up.
+    return get_predictor(model_choice)
+
+
 # -----------------------------------------------------------------------------
 # 1. Page Configuration
 # -----------------------------------------------------------------------------
@@ -1418,10 +1432,15 @@ with st.container():
                         temp_paths.append(t_path)
                         file_map[t_path] = up_file.name
                     
-                    # 1. Baseline Model (Sequential)
+                    # 1. Baseline Model (Batch)
                     if "Standard" in analysis_mode:
-                        for idx, t_path in enumerate(temp_paths):
-                            pred_label, proba, _ = predict_baseline(t_path, model_choice="rf")
+                        try:
+                            predictor = get_baseline_predictor("rf")
+                        except FileNotFoundError as e:
+                            st.error(f"Baseline model files not found: {e}")
+                            predictor = None
+                        preds = predictor.predict_many(temp_paths) if predictor else [(None, None)] * len(temp_paths)
+                        for idx, (t_path, (pred_label, proba)) in enumerate(zip(temp_paths, preds)):
                             conf = float(np.max(proba) * 100) if proba is not None else 0.0
                             
                             res = {
@@ -1441,14 +1460,22 @@ with st.container():
                         
                         # Preprocess Batch
                         st.write("Preprocessing batch...")
-                        residuals = process_batch_gpu(temp_paths)
+                        batch = process_batch_gpu(temp_paths)
+                        for failed_path in batch.failed:
+                            batch_results.append({
+                                "file": file_map[failed_path],
+                                "brand": "Unknown",
+                                "model": "Unknown",
+                                "confidence": 0.0,
+                                "serial": "N/A"
+                            })
                         
-                        if residuals:
-                            residuals = np.array(residuals, dtype=np.float32)
+                        if len(batch):
+                            residuals = batch.residuals
                             res_resources = get_hybrid_resources()
                             
                             # Feature Extraction
-                            corrs = batch_corr_gpu(residuals, res_resources['fps'], res_resources['fp_keys'])
+                            corrs = batch_corr_gpu(residuals, res_resources['fp_bank'])
                             
                             enh_feats = []
                             for resid in residuals:
@@ -1467,7 +1494,7 @@ with st.container():
                                 conf = float(prob[idx] * 100)
                                 
                                 batch_results.append({
-                                    "file": file_map[temp_paths[i]],
+                                    "file": file_map[batch.paths[i]],
                                     "brand": label.split(' ')[0],
                                     "model": label,
                                     "confidence": conf,
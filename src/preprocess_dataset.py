@@ -0,0 +1,30 @@
+import os
+from preprocessing import DatasetSource, get_source, register_source, preprocess_source, build_arg_parser, SOURCES
+
+
+def parse_args():
+    p = build_arg_parser("Preprocess any registered dataset source (residual patches + metadata CSV).")
+    p.add_argument("--source", "-s", action="append",
+                   help=f"Registered source name, repeatable. Known: {sorted(SOURCES)}. Default: all.")
+    p.add_argument("--data-dir", help="Ad-hoc source: image root laid out as <scanner>/<subfolder>/<image>.")
+    p.add_argument("--name", help="Ad-hoc source: main_class written to the CSV (default: data-dir basename).")
+    p.add_argument("--output-dir", help="Ad-hoc source: output folder (default: processed_data/<name>).")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.data_dir:
+        name = args.name or os.path.basename(os.path.normpath(args.data_dir))
+        out_dir = args.output_dir or os.path.join("processed_data", name)
+        sources = [register_source(DatasetSource(name, args.data_dir, out_dir))]
+    else:
+        sources = [get_source(n) for n in (args.source or sorted(SOURCES))]
+
+    for source in sources:
+        failures = preprocess_source(source, workers=args.workers, chunksize=args.chunksize,
+                                     incremental=args.incremental, patch_stride=args.patch_stride,
+                                     max_patches=args.max_patches, output_format=args.format,
+                                     denoiser=args.denoiser)
+        print(f" {source.name} preprocessing complete ({len(failures)} failures).")
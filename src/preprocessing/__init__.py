@@ -0,0 +1,53 @@
+"""
+preprocessing
+Shared image preprocessing used by every training and inference entry point.
+- loading:     image decode / gray / resize / normalise
+- residual:    noise residuals, batched Haar denoising and patch tiling
+- features:    baseline metadata features
+- sources:     pluggable dataset sources (Official, Wikipedia, ...)
+- engine:      process-pool runner with ordered results
+- patch_store: memory-mappable residual patch shards
+- pipeline:    per-dataset preprocessing (patches + metadata CSV)
+- cache:       content-hashed manifest / array cache for incremental runs
+- tables:      CSV / Parquet metadata tables
+- merge:       out-of-core clean / combine with hashed row dedup
+- residual_store: memory-mappable full-size residuals for the hybrid CNN
+- denoisers:   named, batch-capable denoisers for residual extraction
+- fingerprints: streaming scanner fingerprints (mean / PRNU MLE) with saved state
+- correlation: normalised fingerprint bank, residual correlation as one GEMM
+"""
+
+from .loading import (
+    load_and_preprocess, to_gray, resize_to, normalize_img, load_residual_input,
+    METADATA_SIZE, RESIDUAL_SIZE,
+)
+from .residual import extract_noise_residual, extract_patches, patch_grid, haar_denoise, haar_residual
+from .denoisers import (
+    DENOISERS, register_denoiser, get_denoiser, canonical_denoiser, denoise, noise_residual, estimate_sigma,
+)
+from .features import (
+    compute_metadata_features, metadata_feature_matrix, metadata_row,
+    FEATURE_COLUMNS, METADATA_FIELDS, ID_COLUMNS,
+)
+from .sources import DatasetSource, register_source, get_source, SOURCES
+from .engine import (
+    collect_image_tasks, iter_parallel, map_to_shared, SharedMapper, write_failures, IMAGE_EXTS, DEFAULT_WORKERS, DEFAULT_CHUNKSIZE,
+)
+from .patch_store import PatchStore, PatchStoreWriter
+from .pipeline import preprocess_source, build_arg_parser, PATCH_SIZE, PATCH_STRIDE, DENOISER
+from .cache import Manifest, ArrayCache, file_hash, params_key
+from .tables import (
+    MetadataWriter, TableWriter, read_metadata, write_metadata, iter_metadata, table_columns,
+    find_table, with_format, table_format, CHUNK_ROWS,
+)
+from .merge import stream_merge, RowHashSet, row_hashes
+from .residual_store import (
+    ResidualStore, ResidualStoreWriter, residual_shard, parse_shard, import_residual_pickle,
+)
+from .fingerprints import (
+    FingerprintAccumulator, PRNUAccumulator, FingerprintState, SourceImages, FINGERPRINT_ENGINES, FP_BATCH,
+    zero_mean_rows_cols, wiener_dft,
+)
+from .correlation import (
+    FingerprintBank, normalise_rows, load_bank, resolve_backend, cuda_visible, BANK_FILE, CORR_BACKEND, CORR_BACKENDS,
+)
@@ -0,0 +1,141 @@
+"""
+cache.py
+Content-hashed bookkeeping for incremental preprocessing.
+- Manifest: JSON file tracking every processed image by content hash, valid
+  only for the preprocessing parameters it was built with.
+- ArrayCache: content-addressed .npy cache for per-image results (residuals).
+- file_hash / params_key: the two halves of a cache key.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """sha256 of the file contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def params_key(params):
+    """Short stable digest of a preprocessing-parameter dict."""
+    blob = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+class Manifest:
+    """
+    Manifest of processed images: entries[img_path] = {"hash", "size", "mtime", **data}.
+
+    The whole manifest is tied to one params dict (image size, denoiser, patch
+    size/stride, ...). Loading it with different params starts from empty, so
+    every image is reprocessed. size/mtime are only a shortcut to skip
+    re-hashing files that were not touched; the content hash is what decides.
+    """
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.key = params_key(params)
+        self.entries = {}
+        self.params_changed = False
+
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("params_key") == self.key:
+                self.entries = data.get("entries", {})
+            else:
+                print(f" Preprocessing parameters changed since {path} was written; rebuilding.")
+                self.params_changed = True
+
+    def content_hash(self, img_path):
+        st = os.stat(img_path)
+        entry = self.entries.get(img_path)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime_ns:
+            return entry["hash"]
+        return file_hash(img_path)
+
+    def check(self, img_path):
+        """
+        (current, content_hash): whether img_path was processed with these params
+        and is unchanged, plus its hash when one had to be computed (None for
+        new paths, which are not hashed here), so callers can reuse it in update().
+        """
+        entry = self.entries.get(img_path)
+        if entry is None:
+            return False, None
+        content_hash = self.content_hash(img_path)
+        return entry["hash"] == content_hash, content_hash
+
+    def is_current(self, img_path):
+        """True if img_path was processed with these params and its content is unchanged."""
+        return self.check(img_path)[0]
+
+    def update(self, img_path, content_hash=None, **data):
+        st = os.stat(img_path)
+        self.entries[img_path] = {
+            "hash": content_hash or file_hash(img_path),
+            "size": st.st_size,
+            "mtime": st.st_mtime_ns,
+            **data,
+        }
+
+    def remove(self, img_path):
+        self.entries.pop(img_path, None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"params": self.params, "params_key": self.key, "entries": self.entries}, f)
+        os.replace(tmp, self.path)
+
+
+class ArrayCache:
+    """
+    Content-addressed cache of per-image arrays: <cache_dir>/<content hash>_<params key>.npy.
+    Identical files share an entry regardless of path; a params change simply
+    misses every old entry. A Manifest next to the arrays remembers the hash of
+    each path so untouched files are not re-hashed on every run.
+    """
+
+    def __init__(self, cache_dir, params):
+        self.cache_dir = cache_dir
+        self.key = params_key(params)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.manifest = Manifest(os.path.join(cache_dir, f"manifest_{self.key}.json"), params)
+        self.hits = 0
+        self.misses = 0
+
+    def _array_path(self, content_hash):
+        return os.path.join(self.cache_dir, f"{content_hash}_{self.key}.npy")
+
+    def lookup(self, img_path):
+        """(cached array or None, content hash) for img_path's current content; pass the hash on to put()."""
+        content_hash = self.manifest.content_hash(img_path)
+        path = self._array_path(content_hash)
+        if os.path.exists(path):
+            self.hits += 1
+            self.manifest.update(img_path, content_hash=content_hash)
+            return np.load(path), content_hash
+        self.misses += 1
+        return None, content_hash
+
+    def get(self, img_path):
+        """Cached array for img_path's current content, or None."""
+        return self.lookup(img_path)[0]
+
+    def put(self, img_path, arr, content_hash=None):
+        """Store arr for img_path; content_hash (from lookup) saves hashing the file again."""
+        content_hash = content_hash or file_hash(img_path)
+        np.save(self._array_path(content_hash), arr)
+        self.manifest.update(img_path, content_hash=content_hash)
+
+    def save(self):
+        self.manifest.save()
@@ -0,0 +1,226 @@
+"""
+correlation.py
+Residual-to-fingerprint correlation for the hybrid CNN PRNU features.
+- FingerprintBank: scanner fingerprints normalised (zero mean, unit norm) and
+  laid out once as a contiguous (K, D) float32 matrix, persisted next to
+  scanner_fingerprints.pkl; correlating a batch is then one GEMM.
+- normalise_rows: vectorised zero-mean / unit-norm rows of an (N, ...) batch.
+- Backends for the GEMM: "numpy" (BLAS, default on CPU hosts), "tf" / "torch"
+  (only picked by "auto" when a CUDA device is visible). Neither framework is
+  imported unless its backend is actually used.
+- FingerprintBank.pce: FFT cross-correlation over all circular shifts and the
+  peak-to-correlation-energy of every residual x fingerprint pair; queries
+  may be shifted or cropped (smaller than the fingerprints).
+"""
+
+import os
+import glob
+import shutil
+import subprocess
+import pickle
+import importlib.util
+import numpy as np
+from scipy import fft as sfft
+
+
+BANK_FILE = "fingerprint_bank.npz"
+CORR_BACKEND = os.environ.get("TRACESCOPE_CORR_BACKEND", "auto")  # auto / numpy / tf / torch
+PCE_RADIUS = 5      # peak neighbourhood (2r+1)^2 left out of the correlation energy
+PAIR_CHUNK = 256    # query x fingerprint correlation surfaces held in memory at once
+
+
+def normalise_rows(x):
+    """(N, ...) -> (N, D) float32 rows with zero mean and unit norm (all-constant rows stay 0)."""
+    x = np.asarray(x, dtype=np.float32)
+    x = x.reshape(len(x), -1) - x.reshape(len(x), -1).mean(axis=1, keepdims=True)
+    norm = np.linalg.norm(x, axis=1, keepdims=True)
+    np.divide(x, norm, out=x, where=norm > 0)
+    return x
+
+
+def cuda_visible():
+    """
+    True if an NVIDIA GPU is visible, checked without importing TF / torch:
+    a device under /proc/driver/nvidia/gpus, or at least one "GPU n:" line
+    from nvidia-smi -L (a driver install alone does not count).
+    """
+    if os.environ.get("CUDA_VISIBLE_DEVICES", "0").strip() in ("", "-1"):
+        return False
+    if glob.glob("/proc/driver/nvidia/gpus/*"):
+        return True
+    smi = shutil.which("nvidia-smi")
+    if smi is None:
+        return False
+    try:
+        out = subprocess.run([smi, "-L"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return any(line.startswith("GPU ") for line in out.splitlines())
+
+
+_RESOLVED = {}  # requested backend name -> concrete backend, resolved once per process
+_DEVICES = {}   # framework -> device string
+
+
+def resolve_backend(backend=None):
+    """Concrete backend for a name; "auto" is tf / torch with a GPU (if installed), else numpy."""
+    backend = backend or CORR_BACKEND
+    if backend not in _RESOLVED:
+        _RESOLVED[backend] = _resolve_backend(backend)
+    return _RESOLVED[backend]
+
+
+def _resolve_backend(backend):
+    if backend != "auto":
+        if backend not in CORR_BACKENDS:
+            raise KeyError(f"Unknown correlation backend: {backend}. Available: {sorted(CORR_BACKENDS)}")
+        return backend
+    if cuda_visible():
+        for name, module in (("tf", "tensorflow"), ("torch", "torch")):
+            if importlib.util.find_spec(module) is not None:
+                return name
+    return "numpy"
+
+
+def _matmul_numpy(a, b):
+    return a @ b.T
+
+
+def _matmul_tf(a, b):
+    import tensorflow as tf
+    if "tf" not in _DEVICES:
+        _DEVICES["tf"] = '/GPU:0' if tf.config.list_physical_devices('GPU') else '/CPU:0'
+    with tf.device(_DEVICES["tf"]):
+        return tf.matmul(tf.convert_to_tensor(a), tf.convert_to_tensor(b), transpose_b=True).numpy()
+
+
+def _matmul_torch(a, b):
+    import torch
+    if "torch" not in _DEVICES:
+        _DEVICES["torch"] = "cuda" if torch.cuda.is_available() else "cpu"
+    device = _DEVICES["torch"]
+    with torch.no_grad():
+        return (torch.from_numpy(a).to(device) @ torch.from_numpy(b).to(device).T).cpu().numpy()
+
+
+# (N, D) x (K, D) -> (N, K), float32
+CORR_BACKENDS = {"numpy": _matmul_numpy, "tf": _matmul_tf, "torch": _matmul_torch}
+
+
+class FingerprintBank:
+    """
+    Normalised fingerprint matrix in a fixed key order.
+
+    Example:
+        bank = FingerprintBank.from_fingerprints(scanner_fps, fp_keys)
+        bank.save("results/hybrid_cnn/fingerprint_bank.npz")
+        corrs = bank.correlate(residuals)   # (N, K), columns in bank.keys order
+    """
+
+    def __init__(self, keys, matrix, shape):
+        self.keys = list(keys)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)  # (K, D)
+        self.shape = tuple(shape)
+        self._spectra = None
+
+    @classmethod
+    def from_fingerprints(cls, fingerprints, keys=None):
+        """fingerprints: {scanner: (H, W) or (H, W, 1)}; keys fixes the column order (default: sorted)."""
+        keys = sorted(fingerprints) if keys is None else list(keys)
+        if not keys:
+            raise ValueError("No fingerprints to build a bank from")
+        fps = np.stack([np.asarray(fingerprints[k], dtype=np.float32).squeeze() for k in keys])
+        return cls(keys, normalise_rows(fps), fps.shape[1:])
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def correlate(self, residuals, backend=None):
+        """
+        Zero-lag normalised correlation of (N, H, W) residuals with every
+        fingerprint -> (N, K); one GEMM on the given backend (default CORR_BACKEND).
+        """
+        if len(residuals) == 0:
+            return np.empty((0, len(self)), dtype=np.float32)
+        return CORR_BACKENDS[resolve_backend(backend)](normalise_rows(residuals), self.matrix)
+
+    def precompute(self):
+        """Compute the fingerprint FFTs used by pce() now instead of on the first query."""
+        if self._spectra is None:
+            self._spectra = sfft.rfft2(self.matrix.reshape((len(self),) + self.shape), workers=-1)
+        return self
+
+    @property
+    def spectra(self):
+        """(K, H, W // 2 + 1) rfft2 of the normalised fingerprints, computed on first use."""
+        return self.precompute()._spectra
+
+    def pce(self, residuals, radius=PCE_RADIUS, return_shifts=False):
+        """
+        Peak-to-correlation energy of (N, h, w) residuals (or one (h, w)
+        residual) against every fingerprint over all shifts -> (N, K).
+        Queries smaller than the fingerprints (crops) are zero-padded; the
+        peak position is where the query's top-left corner sits in the
+        fingerprint, returned as (N, K, 2) (dy, dx) with return_shifts.
+        Empty input gives (0, K). The peak keeps its sign, so
+        anti-correlated matches score negative.
+        """
+        H, W = self.shape
+        k = len(self)
+        if len(residuals) == 0:
+            scores, shifts = np.empty((0, k), dtype=np.float32), np.empty((0, k, 2), dtype=np.int64)
+            return (scores, shifts) if return_shifts else scores
+        q = np.asarray(residuals, dtype=np.float32)
+        if q.ndim == 4:
+            q = q[..., 0]
+        if q.ndim == 2:
+            q = q[None]
+        n, h, w = q.shape
+        if h > H or w > W:
+            raise ValueError(f"Query {h}x{w} is larger than the fingerprints ({H}x{W})")
+        q = q - q.mean(axis=(1, 2), keepdims=True)
+        Q = sfft.rfft2(q, s=(H, W), workers=-1)
+
+        scores = np.empty((n, k), dtype=np.float32)
+        shifts = np.empty((n, k, 2), dtype=np.int64)
+        dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        step = max(1, PAIR_CHUNK // k)
+        for start in range(0, n, step):
+            # xc[i, j, s] = sum_x q_i(x) * fp_j(x + s)
+            xc = sfft.irfft2(np.conj(Q[start:start + step, None]) * self.spectra[None], s=(H, W), workers=-1)
+            flat = xc.reshape(xc.shape[0], k, H * W)
+            peak_idx = np.abs(flat).argmax(axis=2)
+            peak = np.take_along_axis(flat, peak_idx[..., None], axis=2)[..., 0]
+
+            py, px = np.divmod(peak_idx, W)
+            nbr = ((py[..., None, None] + dy) % H) * W + (px[..., None, None] + dx) % W
+            nbr_energy = (np.take_along_axis(flat, nbr.reshape(nbr.shape[:2] + (-1,)), axis=2) ** 2).sum(axis=2)
+            energy = ((flat ** 2).sum(axis=2) - nbr_energy) / (H * W - dy.size)
+
+            scores[start:start + step] = np.sign(peak) * peak ** 2 / np.maximum(energy, np.finfo(np.float32).tiny)
+            shifts[start:start + step] = np.stack([py, px], axis=-1)
+        return (scores, shifts) if return_shifts else scores
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, keys=np.array(self.keys, dtype=str), matrix=self.matrix, shape=np.array(self.shape))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["keys"].tolist(), data["matrix"], data["shape"].tolist())
+
+
+def load_bank(bank_path, fingerprints_path=None, keys=None):
+    """Saved FingerprintBank, or one built from scanner_fingerprints.pkl when the bank file is missing."""
+    if os.path.exists(bank_path):
+        return FingerprintBank.load(bank_path)
+    with open(fingerprints_path, "rb") as f:
+        fingerprints = pickle.load(f)
+    return FingerprintBank.from_fingerprints(fingerprints, keys)
@@ -0,0 +1,185 @@
+"""
+denoisers.py
+Registry of batch-capable denoisers for noise residual extraction.
+Every denoiser maps a float array of shape (..., H, W) (one image or a
+batch) to a denoised array of the same shape; residual = x - denoise(x).
+
+    haar            level-1 Haar, detail bands zeroed (fastest; hybrid CNN default)
+    haar_multilevel multi-level orthonormal Haar with per-subband BayesShrink soft
+                    thresholds (batched re-implementation of skimage_wavelet)
+    wiener          5x5 adaptive Wiener filter (same maths as scipy.signal.wiener)
+    bm3d_lite       8x8 block-DCT hard thresholding on two shifted grids
+                    (BM3D's first-stage shrinkage without block matching)
+    skimage_wavelet skimage denoise_wavelet (BayesShrink, db1), per image; slowest,
+                    used by the metadata/patch pipeline
+
+Register new methods with register_denoiser().
+"""
+
+import numpy as np
+from scipy import ndimage
+from scipy.fft import dctn, idctn
+
+from .residual import haar_denoise
+
+
+DENOISERS = {}
+
+WAVELET_LEVELS = None  # None: skimage's default, log2(min(H, W)) - 3
+WIENER_SIZE = 5
+DCT_BLOCK = 8
+DCT_THRESHOLD = 2.7  # x sigma, BM3D's hard-threshold factor
+MAD_SCALE = 0.6745
+
+
+def register_denoiser(name, fn=None):
+    """Register fn under name; usable as a decorator (@register_denoiser("name"))."""
+    if fn is None:
+        return lambda f: register_denoiser(name, f)
+    DENOISERS[name] = fn
+    return fn
+
+
+def get_denoiser(name):
+    if name not in DENOISERS:
+        raise KeyError(f"Unknown denoiser: {name}. Available: {sorted(DENOISERS)}")
+    return DENOISERS[name]
+
+
+def canonical_denoiser(name):
+    """First name registered for name's function ("wavelet" -> "haar"), so aliases share cache keys."""
+    fn = get_denoiser(name)
+    return next(n for n, f in DENOISERS.items() if f is fn)
+
+
+def denoise(x, method="haar"):
+    return get_denoiser(method)(x)
+
+
+def noise_residual(x, method="haar"):
+    """float32 residual x - denoise(x, method) of one image or a batch."""
+    x = np.asarray(x, dtype=np.float32)
+    return (x - denoise(x, method)).astype(np.float32, copy=False)
+
+
+def _pad_to_multiple(x, multiple, mode="edge"):
+    h, w = x.shape[-2:]
+    pad = [(0, 0)] * (x.ndim - 2) + [(0, -h % multiple), (0, -w % multiple)]
+    return np.pad(x, pad, mode=mode) if any(p[1] for p in pad) else x
+
+
+def _haar_dwt(x):
+    """One orthonormal 2D Haar level: (a, (h, v, d)) at half resolution."""
+    x00, x01 = x[..., 0::2, 0::2], x[..., 0::2, 1::2]
+    x10, x11 = x[..., 1::2, 0::2], x[..., 1::2, 1::2]
+    a = (x00 + x01 + x10 + x11) / 2
+    h = (x00 - x01 + x10 - x11) / 2
+    v = (x00 + x01 - x10 - x11) / 2
+    d = (x00 - x01 - x10 + x11) / 2
+    return a, (h, v, d)
+
+
+def _haar_idwt(a, details):
+    h, v, d = details
+    out = np.empty(a.shape[:-2] + (2 * a.shape[-2], 2 * a.shape[-1]), dtype=a.dtype)
+    out[..., 0::2, 0::2] = (a + h + v + d) / 2
+    out[..., 0::2, 1::2] = (a - h + v - d) / 2
+    out[..., 1::2, 0::2] = (a + h - v - d) / 2
+    out[..., 1::2, 1::2] = (a - h - v + d) / 2
+    return out
+
+
+def estimate_sigma(x):
+    """Per-image noise sigma from the finest Haar diagonal band (MAD), shape (..., 1, 1)."""
+    _, (_, _, d) = _haar_dwt(_pad_to_multiple(np.asarray(x, dtype=np.float32), 2))
+    return np.median(np.abs(d), axis=(-2, -1), keepdims=True) / MAD_SCALE
+
+
+def _soft(c, t):
+    return np.sign(c) * np.maximum(np.abs(c) - t, 0)
+
+
+@register_denoiser("haar")
+def haar(x):
+    return haar_denoise(x)
+
+
+# processing.py's historical name for the Haar denoiser
+register_denoiser("wavelet", haar)
+
+
+@register_denoiser("haar_multilevel")
+def haar_multilevel(x, levels=WAVELET_LEVELS):
+    """
+    Multi-level Haar with BayesShrink soft thresholds per detail subband and
+    image. Matches skimage denoise_wavelet (db1, BayesShrink) on power-of-two
+    sizes; other sizes differ slightly at the borders (edge vs symmetric padding).
+    """
+    x = np.asarray(x, dtype=np.float32)
+    h, w = x.shape[-2:]
+    if levels is None:
+        levels = max(int(np.log2(min(h, w))) - 3, 1)
+    a = _pad_to_multiple(x, 2 ** levels)
+    sigma = estimate_sigma(x)
+    var_n = sigma ** 2
+
+    bands = []
+    for _ in range(levels):
+        a, details = _haar_dwt(a)
+        shrunk = []
+        for c in details:
+            var_x = np.maximum(np.mean(c * c, axis=(-2, -1), keepdims=True) - var_n, 1e-12)
+            shrunk.append(_soft(c, var_n / np.sqrt(var_x)))
+        bands.append(shrunk)
+
+    for details in reversed(bands):
+        a = _haar_idwt(a, details)
+    return a[..., :h, :w]
+
+
+@register_denoiser("wiener")
+def wiener(x, size=WIENER_SIZE):
+    """Adaptive Wiener filter, noise power = mean local variance of each image."""
+    x = np.asarray(x, dtype=np.float64)
+    win = (1,) * (x.ndim - 2) + (size, size)
+    # Zero padding, like the 'same' correlation scipy.signal.wiener uses
+    l_mean = ndimage.uniform_filter(x, win, mode="constant")
+    l_var = ndimage.uniform_filter(x * x, win, mode="constant") - l_mean ** 2
+    noise = l_var.mean(axis=(-2, -1), keepdims=True)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = (x - l_mean) * (1 - noise / l_var) + l_mean
+    return np.where(l_var < noise, l_mean, out)
+
+
+def _block_dct_shrink(x, threshold, offset, block=DCT_BLOCK):
+    """Hard-threshold the DCT of non-overlapping blocks of a grid shifted by offset."""
+    h, w = x.shape[-2:]
+    lead = [(0, 0)] * (x.ndim - 2)
+    xp = np.pad(x, lead + [(offset, 0), (offset, 0)], mode="reflect") if offset else x
+    xp = _pad_to_multiple(xp, block, mode="reflect")
+    H, W = xp.shape[-2:]
+
+    blocks = xp.reshape(xp.shape[:-2] + (H // block, block, W // block, block))
+    coef = dctn(blocks, axes=(-3, -1), norm="ortho")
+    keep = np.abs(coef) >= threshold[..., None, None]
+    keep[..., 0, :, 0] = True  # DC of every block
+    den = idctn(coef * keep, axes=(-3, -1), norm="ortho").reshape(xp.shape)
+    return den[..., offset:offset + h, offset:offset + w]
+
+
+@register_denoiser("bm3d_lite")
+def bm3d_lite(x, block=DCT_BLOCK):
+    """Block-DCT hard thresholding at DCT_THRESHOLD * sigma, averaged over two half-block-shifted grids."""
+    x = np.asarray(x, dtype=np.float32)
+    threshold = DCT_THRESHOLD * estimate_sigma(x)
+    return (_block_dct_shrink(x, threshold, 0, block) + _block_dct_shrink(x, threshold, block // 2, block)) / 2
+
+
+@register_denoiser("skimage_wavelet")
+def skimage_wavelet(x):
+    from skimage.restoration import denoise_wavelet
+    x = np.asarray(x)
+    flat = x.reshape((-1,) + x.shape[-2:])
+    out = np.stack([denoise_wavelet(img, channel_axis=None, rescale_sigma=True) for img in flat])
+    return out.reshape(x.shape)
@@ -0,0 +1,218 @@
+"""
+engine.py
+Process-pool engine shared by every preprocessing entry point.
+- Walks a dataset tree into a sorted task list (deterministic order).
+- Fans per-image work out over worker processes in fixed-size chunks.
+- Yields results back in input order; per-image failures are reported
+  alongside instead of aborting the run.
+- map_to_shared / SharedMapper: fixed-shape array results are written by the
+  workers straight into one shared-memory buffer instead of being pickled
+  back; a SharedMapper keeps its pool and buffer across calls.
+"""
+
+import os
+import csv
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from itertools import repeat
+
+
+IMAGE_EXTS = ('.png', '.tif', '.jpg', '.jpeg')
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_CHUNKSIZE = 8
+
+
+def collect_image_tasks(dataset_dir, exts=IMAGE_EXTS):
+    """
+    Walk dataset_dir and return a sorted list of (img_path, scanner_id, subfolder) tasks.
+    scanner_id / subfolder are inferred exactly like the old sequential walk:
+    data/<dataset>/<scanner_id>/<subfolder>/<file>.
+    """
+    tasks = []
+    for root, dirs, files in os.walk(dataset_dir):
+        dirs.sort()
+        # Skip root if it's the main dataset folder (to infer scanner_id)
+        if root == dataset_dir:
+            continue
+
+        scanner_id = os.path.basename(os.path.dirname(root))
+        subfolder_name = os.path.basename(root)
+        for file in sorted(files):
+            if file.lower().endswith(exts):
+                tasks.append((os.path.join(root, file), scanner_id, subfolder_name))
+    return tasks
+
+
+def _safe_call(fn, task):
+    """Run fn(task) in a worker and turn any exception into an error string."""
+    try:
+        return fn(task), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def iter_parallel(fn, tasks, workers=DEFAULT_WORKERS, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Apply fn to every task on a process pool.
+
+    Args:
+        fn: picklable callable (module-level function or functools.partial of one)
+        tasks: list of task tuples
+        workers: number of worker processes (<= 1 runs in-process)
+        chunksize: tasks shipped to a worker per round-trip
+
+    Yields:
+        (task, result, error) in input order; error is None on success.
+    """
+    if not tasks:
+        return
+
+    if workers is None or workers <= 1:
+        for task in tasks:
+            result, error = _safe_call(fn, task)
+            yield task, result, error
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        outputs = executor.map(_safe_call, repeat(fn), tasks, chunksize=max(1, chunksize))
+        for task, (result, error) in zip(tasks, outputs):
+            yield task, result, error
+
+
+_SHARED = None
+
+
+def _attach_shared(fn, name, shape, dtype):
+    """Pool initializer: keep fn and map the parent's shared buffer once per worker."""
+    global _SHARED
+    shm = shared_memory.SharedMemory(name=name)
+    _SHARED = (fn, shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+NO_RESULT = "no result (fn returned None)"
+
+
+def _fill_shared(start, items):
+    """
+    Run the worker's fn over one chunk, writing results into rows start.. of
+    the shared buffer; returns the per-item error (None on success).
+    """
+    fn, _, out = _SHARED
+    errors = []
+    for k, item in enumerate(items):
+        result, error = _safe_call(fn, item)
+        if result is not None:
+            out[start + k] = result
+        errors.append(None if result is not None else error or NO_RESULT)
+    return errors
+
+
+class SharedMapper:
+    """
+    Reusable map_to_shared: one process pool and one (capacity, *item_shape)
+    shared-memory buffer for many calls, so a run that processes its files
+    in chunks pays for pool start-up and pickling fn only once.
+
+    Example:
+        with SharedMapper(fn, (256, 256), capacity=512) as mapper:
+            for chunk in chunks:
+                out, ok = mapper.map(chunk)
+    """
+
+    def __init__(self, fn, item_shape, capacity, dtype=np.float32, workers=DEFAULT_WORKERS,
+                 chunksize=DEFAULT_CHUNKSIZE):
+        self.fn = fn
+        self.item_shape = tuple(item_shape)
+        self.capacity = max(1, int(capacity))
+        self.dtype = np.dtype(dtype)
+        self.chunksize = max(1, chunksize)
+        self.shm = None
+        self.executor = None
+        if workers is not None and workers > 1:
+            shape = (self.capacity,) + self.item_shape
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * self.dtype.itemsize))
+            self.buffer = np.ndarray(shape, dtype=self.dtype, buffer=self.shm.buf)
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared,
+                                                initargs=(fn, self.shm.name, shape, self.dtype.str))
+
+    def map(self, items, return_errors=False):
+        """
+        Apply fn (returning an item_shape array, or None on failure) to every item.
+
+        Returns:
+            (array, ok): (N, *item_shape) results in input order and a bool mask
+            of the items that succeeded (failed rows are left uninitialised);
+            with return_errors also the (item, error) failures, as iter_parallel reports them
+        """
+        n = len(items)
+        out = np.empty((n,) + self.item_shape, dtype=self.dtype)
+        errors = [None] * n
+        if self.executor is None or n <= self.chunksize:
+            for i, item in enumerate(items):
+                result, error = _safe_call(self.fn, item)
+                if result is not None:
+                    out[i] = result
+                else:
+                    errors[i] = error or NO_RESULT
+        else:
+            # Windows of at most capacity items through the shared buffer
+            for w in range(0, n, self.capacity):
+                window = items[w:w + self.capacity]
+                starts = list(range(0, len(window), self.chunksize))
+                chunks = self.executor.map(_fill_shared, starts, [window[s:s + self.chunksize] for s in starts])
+                errors[w:w + len(window)] = [e for chunk in chunks for e in chunk]
+                # One bulk copy out of shared memory before the next window overwrites it
+                out[w:w + len(window)] = self.buffer[:len(window)]
+
+        ok = np.array([e is None for e in errors], dtype=bool)
+        if return_errors:
+            return out, ok, [(item, e) for item, e in zip(items, errors) if e is not None]
+        return out, ok
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.shm is not None:
+            self.buffer = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def map_to_shared(fn, items, item_shape, dtype=np.float32, workers=DEFAULT_WORKERS, chunksize=DEFAULT_CHUNKSIZE,
+                  return_errors=False):
+    """
+    Apply fn (returning an item_shape array, or None on failure) to every item.
+
+    Workers write into one shared-memory (N, *item_shape) buffer, so results
+    cross the process boundary without pickling; only per-item success flags
+    are sent back. Chunks of `chunksize` items are submitted per task.
+    One-shot: callers mapping many chunks should keep a SharedMapper instead.
+
+    Returns:
+        (array, ok): (N, *item_shape) results in input order and a bool mask
+        of the items that succeeded (failed rows are left uninitialised);
+        with return_errors also the (item, error) failures
+    """
+    if len(items) <= chunksize:
+        workers = 1  # not worth starting a pool
+    with SharedMapper(fn, item_shape, len(items), dtype, workers, chunksize) as mapper:
+        return mapper.map(items, return_errors)
+
+
+def write_failures(failures, csv_path):
+    """Write collected (img_path, error) failures next to the metadata CSV."""
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_path", "error"])
+        writer.writerows(failures)
+    print(f" {len(failures)} failures written to {csv_path}")
+
@@ -0,0 +1,369 @@
+"""
+fingerprints.py
+Streaming scanner fingerprints from flatfield residuals.
+- FingerprintAccumulator ("mean" engine): per-pixel running mean / variance
+  of one scanner's residuals (Welford, merged batch by batch with Chan's
+  update), so only one batch is ever resident.
+- PRNUAccumulator ("mle" engine): maximum-likelihood PRNU estimate
+  K = sum(W * I) / sum(I^2) from residuals W and their images I, followed by
+  zero-mean rows/columns and Wiener filtering in the DFT domain.
+- FingerprintState: accumulators for every scanner plus the residual sources
+  already folded in; saved as one .npz so new flatfield scans can be added to
+  existing fingerprints without recomputing them.
+"""
+
+import os
+import time
+import numpy as np
+from scipy import ndimage
+
+from .loading import load_residual_input, RESIDUAL_SIZE
+
+
+FP_BATCH = 64  # residuals folded per update
+DFT_WIENER_WINDOWS = (3, 5, 7, 9)
+
+
+class FingerprintAccumulator:
+    """
+    Running per-pixel statistics of (H, W) residuals.
+    fingerprint is the mean residual; variance the per-pixel sample variance.
+    """
+
+    needs_images = False
+
+    def __init__(self, shape=None):
+        self.count = 0
+        self.mean_ = None if shape is None else np.zeros(shape, dtype=np.float64)
+        self.m2_ = None if shape is None else np.zeros(shape, dtype=np.float64)
+
+    def update(self, residuals, images=None):
+        """Fold one (H, W) residual or a (B, H, W) batch (images are not used)."""
+        batch = np.asarray(residuals, dtype=np.float64)
+        if batch.ndim == 2:
+            batch = batch[None]
+        if not len(batch):
+            return self
+        n_b = len(batch)
+        mean_b = batch.mean(axis=0)
+        m2_b = ((batch - mean_b) ** 2).sum(axis=0)
+        return self._combine(n_b, mean_b, m2_b)
+
+    def merge(self, other):
+        """Combine with another accumulator (e.g. built on another machine / batch of scans)."""
+        if other.count:
+            self._combine(other.count, other.mean_, other.m2_)
+        return self
+
+    def _combine(self, n_b, mean_b, m2_b):
+        if self.mean_ is None or self.count == 0:
+            self.count = n_b
+            self.mean_ = np.array(mean_b, dtype=np.float64)
+            self.m2_ = np.array(m2_b, dtype=np.float64)
+            return self
+        if mean_b.shape != self.mean_.shape:
+            raise ValueError(f"Residual shape {mean_b.shape} does not match fingerprint {self.mean_.shape}")
+        n = self.count + n_b
+        delta = mean_b - self.mean_
+        self.mean_ += delta * (n_b / n)
+        self.m2_ += m2_b + delta ** 2 * (self.count * n_b / n)
+        self.count = n
+        return self
+
+    @property
+    def fingerprint(self):
+        return self.mean_.astype(np.float32)
+
+    @property
+    def variance(self):
+        """Per-pixel sample variance (zeros until two residuals were folded)."""
+        if self.count < 2:
+            return np.zeros_like(self.mean_, dtype=np.float32)
+        return (self.m2_ / (self.count - 1)).astype(np.float32)
+
+    def state_arrays(self):
+        return {"count": np.array(self.count, dtype=np.int64), "mean": self.mean_, "m2": self.m2_}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        acc = cls()
+        acc.count = int(arrays["count"])
+        acc.mean_, acc.m2_ = arrays["mean"], arrays["m2"]
+        return acc
+
+
+def zero_mean_rows_cols(k):
+    """Remove row and column means of (..., H, W) fingerprints (kills linear-pattern artifacts)."""
+    k = k - k.mean(axis=-1, keepdims=True)
+    return k - k.mean(axis=-2, keepdims=True)
+
+
+def _local_variance(mag, noise_var, windows=DFT_WIENER_WINDOWS):
+    """Minimum over window sizes of the local signal variance max(E[x^2] - noise, 0)."""
+    axes = (1,) * (mag.ndim - 2)
+    est = None
+    for w in windows:
+        v = np.maximum(ndimage.uniform_filter(mag ** 2, axes + (w, w), mode="reflect") - noise_var, 0)
+        est = v if est is None else np.minimum(est, v)
+    return est
+
+
+def wiener_dft(k):
+    """
+    Wiener filtering of (..., H, W) fingerprints in the Fourier domain: the
+    DFT magnitude is shrunk where it peaks above its own noise level, which
+    suppresses periodic (JPEG / scanner-mechanics) components shared across
+    devices while keeping the phase.
+    """
+    h, w = k.shape[-2:]
+    F = np.fft.fft2(k)
+    mag = np.abs(F.real) / np.sqrt(h * w)
+    # A white fingerprint of variance s^2 has E[mag^2] ~ s^2 / 2, so only peaks are shrunk
+    noise_var = k.var(axis=(-2, -1), keepdims=True)
+    filtered = mag * noise_var / (_local_variance(mag, noise_var) + noise_var)
+
+    zero = mag == 0
+    scale = np.where(zero, 0.0, filtered / np.where(zero, 1.0, mag))
+    return np.fft.ifft2(F * scale).real
+
+
+class PRNUAccumulator:
+    """
+    Streaming maximum-likelihood PRNU estimate of one scanner:
+        K = sum_i(W_i * I_i) / sum_i(I_i^2)
+    over residuals W_i and the images I_i they came from. fingerprint applies
+    zero-mean row/column normalisation and Wiener filtering in the DFT domain
+    (raw_fingerprint is the plain estimate).
+    """
+
+    needs_images = True
+
+    def __init__(self):
+        self.count = 0
+        self.num_ = None
+        self.den_ = None
+
+    def update(self, residuals, images=None):
+        """Fold (B, H, W) residuals with their (B, H, W) images (one (H, W) pair also works)."""
+        if images is None:
+            raise ValueError("The mle fingerprint engine needs the flatfield images, not only residuals")
+        w = np.asarray(residuals, dtype=np.float64)
+        i = np.asarray(images, dtype=np.float64)
+        if w.ndim == 2:
+            w, i = w[None], i[None]
+        if w.shape != i.shape:
+            raise ValueError(f"Residuals {w.shape} and images {i.shape} differ in shape")
+        if not len(w):
+            return self
+        num, den = (w * i).sum(axis=0), (i * i).sum(axis=0)
+        if self.num_ is None:
+            self.num_, self.den_ = num, den
+        else:
+            self.num_ += num
+            self.den_ += den
+        self.count += len(w)
+        return self
+
+    def merge(self, other):
+        if other.count:
+            if self.num_ is None:
+                self.num_, self.den_ = other.num_.copy(), other.den_.copy()
+            else:
+                self.num_ += other.num_
+                self.den_ += other.den_
+            self.count += other.count
+        return self
+
+    @property
+    def raw_fingerprint(self):
+        return (self.num_ / np.maximum(self.den_, np.finfo(np.float64).tiny)).astype(np.float32)
+
+    @property
+    def fingerprint(self):
+        return wiener_dft(zero_mean_rows_cols(self.raw_fingerprint.astype(np.float64))).astype(np.float32)
+
+    @property
+    def variance(self):
+        """Per-pixel variance of the estimate, ~ noise / sum(I^2) (relative, for weighting)."""
+        return (1.0 / np.maximum(self.den_, np.finfo(np.float64).tiny)).astype(np.float32)
+
+    def state_arrays(self):
+        return {"count": np.array(self.count, dtype=np.int64), "num": self.num_, "den": self.den_}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        acc = cls()
+        acc.count = int(arrays["count"])
+        acc.num_, acc.den_ = arrays["num"], arrays["den"]
+        return acc
+
+
+FINGERPRINT_ENGINES = {"mean": FingerprintAccumulator, "mle": PRNUAccumulator}
+
+
+class SourceImages:
+    """
+    Lazy (N, H, W) view of the images behind residual sources: read() with a
+    slice or index array decodes just those files (load_residual_input).
+    Sources that are not files on disk (moved scans, <shard>#<n> entries of
+    stores imported from legacy pickles) or fail to decode come back as
+    failed rows instead of raising.
+    """
+
+    def __init__(self, paths, size=RESIDUAL_SIZE):
+        self.paths = np.asarray(paths)
+        self.size = size
+
+    def __len__(self):
+        return len(self.paths)
+
+    def available(self):
+        """Mask of sources that exist as files (cheap check, nothing is decoded)."""
+        return np.array([os.path.isfile(str(p)) for p in self.paths], dtype=bool)
+
+    def read(self, idx):
+        """(images, ok): (B, H, W) float32 images for paths[idx] and a mask of the rows that decoded."""
+        paths = np.atleast_1d(self.paths[idx])
+        imgs = np.zeros((len(paths),) + tuple(self.size), dtype=np.float32)
+        ok = np.zeros(len(paths), dtype=bool)
+        for i, p in enumerate(paths):
+            img = load_residual_input(str(p), self.size) if os.path.isfile(str(p)) else None
+            if img is not None:
+                imgs[i], ok[i] = img, True
+        return imgs, ok
+
+    def __getitem__(self, idx):
+        imgs, ok = self.read(idx)
+        if not ok.all():
+            raise ValueError(f"Could not read source image {np.atleast_1d(self.paths[idx])[~ok][0]}")
+        return imgs
+
+
+class FingerprintState:
+    """
+    Fingerprint accumulators per scanner + the sources folded into each.
+    engine picks the estimator (see FINGERPRINT_ENGINES); build_s holds the
+    seconds spent folding each scanner in this session and skipped the
+    sources whose images could not be read (mle engine; retried next update).
+    discarded_engine is set by load() when a saved state of another engine
+    was ignored.
+
+    Example:
+        state = FingerprintState.load(path)        # empty if path is missing
+        state.update("EpsonV39-1", residuals, sources)
+        state.save(path)
+        fps = state.fingerprints()                 # {scanner: (H, W) float32}
+    """
+
+    def __init__(self, engine="mean"):
+        if engine not in FINGERPRINT_ENGINES:
+            raise KeyError(f"Unknown fingerprint engine: {engine}. Available: {sorted(FINGERPRINT_ENGINES)}")
+        self.engine = engine
+        self.accumulators = {}
+        self.sources = {}
+        self.build_s = {}
+        self.skipped = {}
+        self.discarded_engine = None
+
+    def __len__(self):
+        return len(self.accumulators)
+
+    def scanners(self):
+        return sorted(self.accumulators)
+
+    def new_sources(self, scanner, sources):
+        """Mask of sources not yet folded into scanner's fingerprint."""
+        seen = self.sources.get(scanner, set())
+        return np.array([s not in seen for s in sources], dtype=bool)
+
+    def update(self, scanner, residuals, sources=None, images=None, batch_size=FP_BATCH):
+        """
+        Fold residuals (any (N, H, W) array, memmaps included) into scanner's
+        fingerprint, batch_size at a time. With sources, residuals whose
+        source was already folded are skipped. The mle engine also needs the
+        images (an aligned (N, H, W) array or SourceImages; defaults to
+        SourceImages(sources)). Returns the number folded.
+        """
+        if sources is not None:
+            new = np.flatnonzero(self.new_sources(scanner, sources))
+        else:
+            new = np.arange(len(residuals))
+        if not len(new):
+            return 0
+
+        acc_cls = FINGERPRINT_ENGINES[self.engine]
+        if acc_cls.needs_images and images is None and sources is not None:
+            images = SourceImages(sources)
+
+        t0 = time.perf_counter()
+        contiguous = np.array_equal(new, np.arange(new[0], new[0] + len(new)))
+        folded = np.ones(len(new), dtype=bool)
+        for start in range(0, len(new), batch_size):
+            idx = new[start:start + batch_size]
+            sel = slice(idx[0], idx[-1] + 1) if contiguous else idx
+            batch = residuals[sel]
+            if isinstance(images, SourceImages):
+                # Unreadable sources are left out of this scanner instead of aborting the build
+                imgs, ok = images.read(sel)
+                folded[start:start + len(idx)] = ok
+                if not ok.all():
+                    batch, imgs = np.asarray(batch)[ok], imgs[ok]
+            else:
+                imgs = images[sel] if images is not None else None
+            if len(batch):
+                self.accumulators.setdefault(scanner, acc_cls()).update(batch, imgs)
+        self.build_s[scanner] = self.build_s.get(scanner, 0.0) + time.perf_counter() - t0
+        if sources is not None:
+            sources = np.asarray(sources)
+            self.sources.setdefault(scanner, set()).update(sources[new[folded]].tolist())
+            if not folded.all():
+                self.skipped[scanner] = sources[new[~folded]].tolist()
+        return int(folded.sum())
+
+    def fingerprints(self):
+        return {s: self.accumulators[s].fingerprint for s in self.scanners()}
+
+    def finalise_time(self):
+        """Seconds spent post-processing every fingerprint (e.g. the mle DFT Wiener step)."""
+        t0 = time.perf_counter()
+        self.fingerprints()
+        return time.perf_counter() - t0
+
+    def variances(self):
+        return {s: self.accumulators[s].variance for s in self.scanners()}
+
+    def counts(self):
+        return {s: self.accumulators[s].count for s in self.scanners()}
+
+    def save(self, path):
+        arrays = {"scanners": np.array(self.scanners(), dtype=str), "engine": np.array(self.engine)}
+        for i, s in enumerate(self.scanners()):
+            for name, arr in self.accumulators[s].state_arrays().items():
+                arrays[f"{name}_{i}"] = arr
+            arrays[f"sources_{i}"] = np.array(sorted(self.sources.get(s, ())), dtype=str)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, engine="mean"):
+        """
+        Saved state, or an empty one for engine when path is missing or was
+        built by another engine (then discarded_engine names the saved one).
+        """
+        if not os.path.exists(path):
+            return cls(engine)
+        with np.load(path) as data:
+            saved = str(data["engine"]) if "engine" in data else "mean"
+            if saved != engine:
+                state = cls(engine)
+                state.discarded_engine = saved
+                return state
+            state = cls(engine)
+            acc_cls = FINGERPRINT_ENGINES[engine]
+            for i, s in enumerate(data["scanners"].tolist()):
+                fields = {k[:-len(f"_{i}")]: data[k] for k in data.files if k.endswith(f"_{i}")}
+                state.accumulators[s] = acc_cls.from_arrays(fields)
+                state.sources[s] = set(fields["sources"].tolist())
+        return state
@@ -0,0 +1,45 @@
+"""
+loading.py
+Image decoding and normalisation shared by training and inference.
+- load_and_preprocess: float grayscale at METADATA_SIZE (baseline metadata features).
+- to_gray / resize_to / normalize_img / load_residual_input: float32 grayscale at
+  RESIDUAL_SIZE (hybrid CNN residuals).
+"""
+
+import cv2
+import numpy as np
+from skimage import io, img_as_float
+
+
+METADATA_SIZE = (512, 512)
+RESIDUAL_SIZE = (256, 256)
+
+
+def load_and_preprocess(img_path, size=METADATA_SIZE):
+    """Read an image as float grayscale in [0, 1] and resize it (INTER_AREA)."""
+    try:
+        img = io.imread(img_path, as_gray=True)
+    except Exception as e:
+        raise ValueError(f"Could not load image: {img_path} ({e})") from e
+    img = img_as_float(img)
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+def to_gray(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+def resize_to(img, size=RESIDUAL_SIZE):
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+def normalize_img(img):
+    return img.astype(np.float32) / 255.0
+
+
+def load_residual_input(fpath, size=RESIDUAL_SIZE):
+    """Decode -> gray -> resize -> [0, 1] float32. Returns None if the file can't be read."""
+    img = cv2.imread(fpath, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return None
+    return normalize_img(resize_to(to_gray(img), size))
@@ -0,0 +1,96 @@
+"""
+merge.py
+Out-of-core clean / combine for metadata tables.
+Tables are streamed in chunks; duplicate rows are detected with a sorted
+array of 64-bit row hashes (8 bytes per unique row) instead of holding the
+rows themselves, so peak memory is one chunk plus the hash index no matter
+how many datasets are merged.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .tables import iter_metadata, table_columns, TableWriter, CHUNK_ROWS
+
+
+class RowHashSet:
+    """Set of uint64 row hashes kept as one sorted array."""
+
+    def __init__(self):
+        self._hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add_new(self, hashes):
+        """
+        Insert hashes; return a mask of the ones not seen before (earlier
+        chunks or earlier in this chunk) -- i.e. keep-first semantics.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        _, first = np.unique(hashes, return_index=True)
+        mask = np.zeros(len(hashes), dtype=bool)
+        mask[first] = True
+
+        if len(self._hashes):
+            pos = np.searchsorted(self._hashes, hashes)
+            pos = np.minimum(pos, len(self._hashes) - 1)
+            mask &= self._hashes[pos] != hashes
+
+        new = hashes[mask]
+        if len(new):
+            self._hashes = np.sort(np.concatenate([self._hashes, new]))
+        return mask
+
+
+def row_hashes(df):
+    """
+    64-bit content hash per row (values only, index ignored). Numeric
+    columns are hashed as float64 so 3 and 3.0 match across CSV chunks
+    whose dtypes were inferred differently.
+    """
+    numeric = df.select_dtypes(include="number").columns
+    if len(numeric):
+        df = df.astype({c: np.float64 for c in numeric})
+    return pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+
+
+def stream_merge(input_paths, output_path, columns=None, chunksize=CHUNK_ROWS, seen=None):
+    """
+    Concatenate tables, drop all-empty rows and exact duplicates, and
+    stream the result to output_path (CSV or Parquet by extension).
+
+    Equivalent to pd.concat(...).dropna(how="all").drop_duplicates() with
+    keep="first", up to 64-bit hash collisions. Columns default to those
+    of the first input; other inputs are aligned to them (missing -> NaN).
+
+    Args:
+        seen: optional RowHashSet to share dedup state across calls
+
+    Returns:
+        dict of row counts: read, written, duplicates, empty
+    """
+    if columns is None:
+        columns = table_columns(input_paths[0])
+    seen = seen if seen is not None else RowHashSet()
+    stats = {"read": 0, "written": 0, "duplicates": 0, "empty": 0}
+
+    with TableWriter(output_path, columns=columns) as writer:
+        for path in input_paths:
+            available = set(table_columns(path))
+            read_cols = [c for c in columns if c in available]
+            for chunk in iter_metadata(path, columns=read_cols, chunksize=chunksize):
+                stats["read"] += len(chunk)
+                chunk = chunk.reindex(columns=columns)
+
+                non_empty = chunk.notna().any(axis=1).to_numpy()
+                stats["empty"] += int((~non_empty).sum())
+                chunk = chunk[non_empty]
+
+                keep = seen.add_new(row_hashes(chunk))
+                stats["duplicates"] += int((~keep).sum())
+                chunk = chunk[keep]
+
+                writer.write(chunk)
+                stats["written"] += len(chunk)
+    return stats
@@ -0,0 +1,162 @@
+"""
+patch_store.py
+Consolidated on-disk store for residual patches.
+- One contiguous (N, P, P) array per scanner/dpi shard: <root>/<scanner>/<dpi>.bin
+- store.json holds dtype + patch size, index.csv maps every patch to
+  (shard, source_file, patch_idx, offset).
+- Shards are opened with np.memmap, so slicing them is zero-copy.
+- Incremental runs append to existing shards; patches of re-processed images
+  are dropped from the index (their old bytes stay until the next full rebuild).
+"""
+
+import os
+import csv
+import json
+import numpy as np
+
+
+STORE_META = "store.json"
+STORE_INDEX = "index.csv"
+INDEX_FIELDS = ["shard", "source_file", "patch_idx", "offset"]
+
+
+def shard_name(scanner_id, subfolder):
+    return f"{scanner_id}/{subfolder}"
+
+
+def shard_path(root, shard):
+    return os.path.join(root, *shard.split("/")) + ".bin"
+
+
+def _read_index(root):
+    with open(os.path.join(root, STORE_INDEX), newline="") as f:
+        return list(csv.DictReader(f))
+
+
+class PatchStoreWriter:
+    """
+    Append-only writer. Patches are streamed straight to their shard file,
+    so memory use does not grow with the dataset.
+
+    append=True keeps an existing store (same patch size / dtype) and adds to
+    it; index rows of sources in drop_sources are removed first.
+    """
+
+    def __init__(self, root, patch_size=128, dtype=np.float32, append=False, drop_sources=()):
+        self.root = root
+        self.patch_size = patch_size
+        self.dtype = np.dtype(dtype)
+        self._files = {}
+        self._counts = {}
+
+        kept_rows = []
+        append = append and os.path.exists(os.path.join(root, STORE_META))
+        if append:
+            with open(os.path.join(root, STORE_META)) as f:
+                meta = json.load(f)
+            if meta != {"dtype": self.dtype.str, "patch_size": patch_size}:
+                raise ValueError(f"Existing patch store {root} has layout {meta}, cannot append")
+            drop = set(drop_sources)
+            kept_rows = [r for r in _read_index(root) if r["source_file"] not in drop]
+
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, STORE_META), "w") as f:
+            json.dump({"dtype": self.dtype.str, "patch_size": patch_size}, f)
+
+        self._index_file = open(os.path.join(root, STORE_INDEX), "w", newline="")
+        self._index = csv.writer(self._index_file)
+        self._index.writerow(INDEX_FIELDS)
+        self._index.writerows([r[k] for k in INDEX_FIELDS] for r in kept_rows)
+        self._append = append
+
+    def add(self, shard, source_file, patches, patch_indices=None):
+        """
+        Append patches (N, P, P) of one source image to a shard.
+        patch_indices: tile index of each patch (defaults to 0..N-1).
+        """
+        patches = np.ascontiguousarray(patches, dtype=self.dtype)
+        if patches.ndim != 3 or patches.shape[1:] != (self.patch_size, self.patch_size):
+            raise ValueError(f"Expected (N, {self.patch_size}, {self.patch_size}) patches, got {patches.shape}")
+
+        if shard not in self._files:
+            path = shard_path(self.root, shard)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self._append and os.path.exists(path):
+                item_bytes = self.patch_size * self.patch_size * self.dtype.itemsize
+                self._counts[shard] = os.path.getsize(path) // item_bytes
+                self._files[shard] = open(path, "ab")
+            else:
+                self._counts[shard] = 0
+                self._files[shard] = open(path, "wb")
+
+        offset = self._counts[shard]
+        self._files[shard].write(patches.tobytes())
+        self._counts[shard] += len(patches)
+        if patch_indices is None:
+            patch_indices = range(len(patches))
+        self._index.writerows(
+            (shard, source_file, int(patch_idx), offset + k) for k, patch_idx in enumerate(patch_indices)
+        )
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PatchStore:
+    """
+    Read-only view over a patch store directory.
+
+    Example:
+        store = PatchStore("processed_data/Official")
+        arr = store.shard("EpsonV39-1/300")         # np.memmap (N, 128, 128)
+        patches = store.patches_for("data/Official/EpsonV39-1/300/s8_1.tif")
+    """
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, STORE_META)) as f:
+            meta = json.load(f)
+        self.dtype = np.dtype(meta["dtype"])
+        self.patch_size = meta["patch_size"]
+
+        # source_file -> (shard, first offset, count); patches of one image are contiguous
+        self.sources = {}
+        for row in _read_index(root):
+            src = row["source_file"]
+            if src in self.sources:
+                shard, start, count = self.sources[src]
+                self.sources[src] = (shard, start, count + 1)
+            else:
+                self.sources[src] = (row["shard"], int(row["offset"]), 1)
+        self._maps = {}
+
+    @property
+    def shards(self):
+        return sorted({shard for shard, _, _ in self.sources.values()})
+
+    def shard(self, name):
+        """Memory-map a whole shard as (N, P, P)."""
+        if name not in self._maps:
+            path = shard_path(self.root, name)
+            item_bytes = self.patch_size * self.patch_size * self.dtype.itemsize
+            n = os.path.getsize(path) // item_bytes
+            self._maps[name] = np.memmap(path, dtype=self.dtype, mode="r",
+                                         shape=(n, self.patch_size, self.patch_size))
+        return self._maps[name]
+
+    def patches_for(self, source_file):
+        """Zero-copy (count, P, P) slice with every patch of one source image."""
+        shard, start, count = self.sources[source_file]
+        return self.shard(shard)[start:start + count]
+
+    def __len__(self):
+        return sum(count for _, _, count in self.sources.values())
@@ -0,0 +1,160 @@
+"""
+pipeline.py
+Dataset preprocessing: residual patches + metadata CSV for one DatasetSource.
+"""
+
+import os
+import zlib
+import argparse
+from functools import partial
+import numpy as np
+
+from .loading import load_and_preprocess, METADATA_SIZE
+from .residual import extract_patches
+from .denoisers import noise_residual, DENOISERS
+from .features import metadata_row
+from .tables import MetadataWriter, with_format
+from .patch_store import PatchStoreWriter, shard_name
+from .engine import iter_parallel, write_failures, DEFAULT_WORKERS, DEFAULT_CHUNKSIZE
+from .cache import Manifest, file_hash
+
+
+PATCH_SIZE = 128
+PATCH_STRIDE = 128
+DENOISER = "skimage_wavelet"
+MANIFEST_NAME = "manifest.json"
+
+
+def pipeline_params(patch_stride=PATCH_STRIDE, max_patches=None, denoiser=DENOISER):
+    """Everything that changes the outputs; a change invalidates the manifest."""
+    return {
+        "size": METADATA_SIZE,
+        "denoiser": denoiser,
+        "patch_size": PATCH_SIZE,
+        "patch_stride": patch_stride,
+        "max_patches": max_patches,
+        "patch_dtype": "float32",
+    }
+
+
+# Per-image work (runs inside a worker process)
+def process_image(task, main_class, patch_stride=PATCH_STRIDE, max_patches=None, denoiser=DENOISER):
+    """
+    task: (img_path, scanner_id, subfolder[, content_hash]); the file is hashed
+    here (in parallel) unless the parent already knows its hash.
+    """
+    img_path, scanner_id, subfolder_name = task[:3]
+    content_hash = (task[3] if len(task) > 3 else None) or file_hash(img_path)
+    img = load_and_preprocess(img_path)
+
+    residual = noise_residual(img, denoiser)
+    # Sub-sampling is seeded by the path so reruns pick the same tiles
+    patches, patch_idx = extract_patches(residual, PATCH_SIZE, patch_stride, max_patches,
+                                         seed=zlib.crc32(img_path.encode()), return_indices=True)
+    features = metadata_row(img, img_path, main_class, scanner_id)
+    return features, patches.astype(np.float32), patch_idx, content_hash
+
+
+def _plain(row):
+    """numpy scalars -> python scalars, so rows can live in the JSON manifest."""
+    return {k: (v.item() if isinstance(v, np.generic) else v) for k, v in row.items()}
+
+
+def preprocess_source(source, csv_path=None, workers=DEFAULT_WORKERS, chunksize=DEFAULT_CHUNKSIZE,
+                      incremental=False, patch_stride=PATCH_STRIDE, max_patches=None, output_format=None,
+                      denoiser=DENOISER):
+    """
+    Preprocess every image of a DatasetSource.
+    Writes metadata_features.csv (or .parquet), the patch store and
+    manifest.json into source.output_dir and returns the list of
+    (img_path, error) failures.
+
+    incremental=True only processes images that are new or whose content
+    changed since the last run (per manifest.json); their rows are merged
+    into the existing CSV and their patches appended to the existing store.
+
+    patch_stride < PATCH_SIZE tiles the residual with overlap; max_patches
+    keeps a random (per-image deterministic) subset of tiles.
+    output_format ("csv" / "parquet") overrides the extension of csv_path.
+    denoiser names the residual denoiser (see denoisers.py).
+    """
+    out_dir = source.output_dir
+    csv_path = csv_path or source.metadata_path(output_format or "csv")
+    if output_format:
+        csv_path = with_format(csv_path, output_format)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Sorted task list -> rows come out in the same order on every run
+    tasks = source.tasks()
+    task_paths = [t[0] for t in tasks]
+
+    manifest = Manifest(os.path.join(out_dir, MANIFEST_NAME), pipeline_params(patch_stride, max_patches, denoiser))
+    incremental = incremental and not manifest.params_changed
+    if not incremental:
+        manifest.entries = {}
+
+    # Images that vanished from disk drop out of every output
+    removed = set(manifest.entries) - set(task_paths)
+    for path in removed:
+        manifest.remove(path)
+    # Pending tasks carry the hash computed while checking them (None for new files)
+    pending = []
+    for t in tasks:
+        current, content_hash = manifest.check(t[0])
+        if not current:
+            pending.append(t + (content_hash,))
+
+    print(f" [{source.name}] {len(tasks)} images, {len(pending)} to process "
+          f"({'incremental' if incremental else 'full'}), using {workers} workers (chunksize={chunksize})")
+
+    failures = []
+    folder_counts = {}
+    drop = removed | {t[0] for t in pending}
+    # Patches go to one memory-mappable array per scanner/dpi shard (see patch_store.py)
+    with PatchStoreWriter(out_dir, PATCH_SIZE, append=incremental, drop_sources=drop) as store:
+        worker_fn = partial(process_image, main_class=source.name,
+                            patch_stride=patch_stride, max_patches=max_patches, denoiser=denoiser)
+        for task, result, error in iter_parallel(worker_fn, pending, workers, chunksize):
+            img_path, scanner_id, subfolder_name, _ = task
+            if error is not None:
+                print(f" Failed to process {img_path}: {error}")
+                failures.append((img_path, error))
+                manifest.remove(img_path)
+                continue
+
+            features, patches, patch_idx, content_hash = result
+            store.add(shard_name(scanner_id, subfolder_name), img_path, patches, patch_idx)
+            manifest.update(img_path, content_hash=content_hash, row=_plain(features))
+            folder = os.path.dirname(img_path)
+            folder_counts[folder] = folder_counts.get(folder, 0) + 1
+
+    # Table is rebuilt from the manifest in task order (cheap; rows are tiny),
+    # streamed out in row-group batches
+    with MetadataWriter(csv_path) as writer:
+        writer.write_rows(manifest.entries[p]["row"] for p in task_paths if p in manifest.entries)
+    manifest.save()
+    print(f" Wrote {writer.rows_written} metadata rows to {csv_path}")
+
+    for folder, count in folder_counts.items():
+        print(f" Processed {count} files in folder: {folder}")
+
+    if failures:
+        write_failures(failures, os.path.join(out_dir, "failures.csv"))
+    return failures
+
+
+def build_arg_parser(description):
+    """Common CLI flags for the preprocessing scripts."""
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument("--workers", "-w", type=int, default=DEFAULT_WORKERS, help="Worker processes (1 = sequential).")
+    p.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Images sent to a worker per round-trip.")
+    p.add_argument("--incremental", "-i", action="store_true",
+                   help="Only process new/changed images (manifest.json) and merge into existing outputs.")
+    p.add_argument("--patch-stride", type=int, default=PATCH_STRIDE,
+                   help=f"Tile stride; < {PATCH_SIZE} gives overlapping patches.")
+    p.add_argument("--max-patches", type=int, default=None, help="Randomly keep at most N patches per image.")
+    p.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                   help="Metadata table format (parquet keeps typed columns, needs pyarrow).")
+    p.add_argument("--denoiser", choices=sorted(DENOISERS), default=DENOISER,
+                   help="Residual denoiser (haar / haar_multilevel are much faster than skimage_wavelet).")
+    return p
@@ -0,0 +1,95 @@
+"""
+residual.py
+Noise residual extraction and patch tiling for the metadata/patch pipeline.
+- haar_denoise / haar_residual: batched level-1 Haar denoising (detail bands
+  zeroed), the reference for both the CPU and TensorFlow hybrid CNN paths.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from skimage.restoration import denoise_wavelet
+
+
+def extract_noise_residual(img):
+    """Residual = image - wavelet-denoised image (skimage BayesShrink)."""
+    denoised = denoise_wavelet(img, channel_axis=None, rescale_sigma=True)
+    return img - denoised
+
+
+def haar_denoise(x):
+    """
+    Level-1 Haar wavelet denoising with all detail bands zeroed, vectorised
+    over any leading batch axes: (..., H, W) -> (..., H, W).
+
+    Equivalent to pywt.idwt2((cA, (0, 0, 0)), 'haar') of pywt.dwt2(x, 'haar'):
+    every 2x2 block is replaced by its mean. Odd sizes are edge-padded like
+    pywt's default symmetric mode and cropped back.
+    """
+    x = np.asarray(x)
+    if x.dtype.kind != "f":
+        x = x.astype(np.float64)
+    h, w = x.shape[-2:]
+    ph, pw = h % 2, w % 2
+    if ph or pw:
+        pad = [(0, 0)] * (x.ndim - 2) + [(0, ph), (0, pw)]
+        x = np.pad(x, pad, mode="edge")
+
+    # Strided 2x2 block sums: no reshape copies, stays in the input dtype
+    approx = x[..., 0::2, 0::2] + x[..., 0::2, 1::2]
+    approx += x[..., 1::2, 0::2]
+    approx += x[..., 1::2, 1::2]
+    approx *= x.dtype.type(0.25)
+
+    den = np.empty_like(x)
+    for di in (0, 1):
+        for dj in (0, 1):
+            den[..., di::2, dj::2] = approx
+    return den[..., :h, :w]
+
+
+def haar_residual(x):
+    """Residual x - haar_denoise(x) as float32, for one (H, W) image or a (B, H, W) batch."""
+    x = np.asarray(x, dtype=np.float32)
+    return x - haar_denoise(x)
+
+
+def patch_grid(img, patch_size=128, stride=128):
+    """
+    Zero-copy, read-only (nH, nW, P, P) view of every patch position.
+    stride < patch_size gives overlapping tiles. Patch (i, j) starts at
+    (i * stride, j * stride), exactly like the old nested-loop tiling.
+    """
+    h, w = img.shape
+    if h < patch_size or w < patch_size:
+        return np.empty((0, 0, patch_size, patch_size), dtype=img.dtype)
+    return sliding_window_view(img, (patch_size, patch_size))[::stride, ::stride]
+
+
+def extract_patches(img, patch_size=128, stride=128, max_patches=None, seed=None, return_indices=False):
+    """
+    Patches as an (N, P, P) array in row-major tile order.
+
+    The (nH, nW) grid axes of patch_grid() cannot be merged into one axis
+    without a copy, so this is a single vectorised gather from the view;
+    use patch_grid() directly when a zero-copy result is needed.
+
+    Args:
+        max_patches: keep a random subset of at most this many tiles (order preserved)
+        seed: seed / np.random.Generator for the sub-sampling
+        return_indices: also return each patch's row-major tile index
+    """
+    grid = patch_grid(img, patch_size, stride)
+    nh, nw = grid.shape[:2]
+    n = nh * nw
+
+    if max_patches is None or max_patches >= n:
+        idx = np.arange(n)
+        patches = grid.reshape(n, patch_size, patch_size)
+    else:
+        rng = np.random.default_rng(seed)
+        idx = np.sort(rng.choice(n, size=max_patches, replace=False))
+        patches = grid[idx // nw, idx % nw]
+
+    if return_indices:
+        return patches, idx
+    return patches
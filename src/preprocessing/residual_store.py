@@ -0,0 +1,126 @@
+"""
+residual_store.py
+Sharded, memory-mapped store for full-size hybrid CNN residuals (replaces
+official_wiki_residuals.pkl / flatfield_residuals.pkl).
+- Same on-disk layout as patch_store: one contiguous (N, H, W) float32 shard
+  per <dataset>/<scanner>/<dpi> (Flatfield: <dataset>/<scanner>).
+- index.csv is the manifest: shard + source path of every residual; the
+  dataset / scanner label / dpi come from the shard name.
+- Consumers slice or stream residuals straight from np.memmap shards
+  instead of unpickling the whole dataset.
+"""
+
+import numpy as np
+
+from .patch_store import PatchStore, PatchStoreWriter, _read_index
+from .loading import RESIDUAL_SIZE
+
+
+def residual_shard(dataset, scanner, dpi=None):
+    return f"{dataset}/{scanner}" if dpi is None else f"{dataset}/{scanner}/{dpi}"
+
+
+def parse_shard(shard):
+    """'official/EpsonV39-1/300' -> ('official', 'EpsonV39-1', '300'); dpi is None for Flatfield shards."""
+    parts = shard.split("/")
+    return parts[0], parts[1], parts[2] if len(parts) > 2 else None
+
+
+class ResidualStoreWriter(PatchStoreWriter):
+    """Streams residuals to their shard as they are computed."""
+
+    def __init__(self, root, size=RESIDUAL_SIZE[0]):
+        super().__init__(root, patch_size=size, dtype=np.float32)
+
+    def add_residual(self, dataset, scanner, dpi, source_file, residual):
+        self.add(residual_shard(dataset, scanner, dpi), source_file, residual[None])
+
+
+class ResidualStore(PatchStore):
+    """
+    Read-only residual dataset. Records keep write order (dataset, scanner,
+    dpi, file), which is the order features / labels are aligned to.
+
+    Example:
+        store = ResidualStore("results/hybrid_cnn/residual_store")
+        idx = store.select(["official", "Wikipedia"])
+        labels = store.labels[idx]
+        for batch_idx, batch in store.iter_batches(idx, 64): ...
+    """
+
+    def __init__(self, root):
+        super().__init__(root)
+        rows = _read_index(root)
+        self.shard_names = np.array([r["shard"] for r in rows])
+        self.offsets = np.array([int(r["offset"]) for r in rows], dtype=np.int64)
+        self.paths = np.array([r["source_file"] for r in rows])
+        parsed = [parse_shard(s) for s in self.shard_names]
+        self.datasets = np.array([p[0] for p in parsed])
+        self.labels = np.array([p[1] for p in parsed])
+        self.dpis = np.array([p[2] for p in parsed], dtype=object)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def select(self, datasets=None):
+        """Record indices belonging to the given datasets (all when None), in store order."""
+        if datasets is None:
+            return np.arange(len(self))
+        return np.flatnonzero(np.isin(self.datasets, list(datasets)))
+
+    def get(self, i):
+        """One residual as a zero-copy (H, W) memmap view."""
+        return self.shard(self.shard_names[i])[self.offsets[i]]
+
+    def take(self, indices):
+        """(len(indices), H, W) float32 array; reads only the requested residuals."""
+        out = np.empty((len(indices), self.patch_size, self.patch_size), dtype=self.dtype)
+        for k, i in enumerate(indices):
+            out[k] = self.get(i)
+        return out
+
+    def iter_batches(self, indices=None, batch_size=64):
+        """Yield (batch_indices, (B, H, W) array) over indices (default: all records)."""
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        for start in range(0, len(indices), batch_size):
+            batch_idx = indices[start:start + batch_size]
+            yield batch_idx, self.take(batch_idx)
+
+    def groups(self, datasets=None):
+        """
+        Yield (dataset, scanner, dpi, residuals, indices) per shard, where
+        residuals is a zero-copy memmap slice when the shard is contiguous.
+        """
+        idx = self.select(datasets)
+        for name in dict.fromkeys(self.shard_names[idx]):
+            g = idx[self.shard_names[idx] == name]
+            offs = self.offsets[g]
+            if np.array_equal(offs, np.arange(offs[0], offs[0] + len(offs))):
+                residuals = self.shard(name)[offs[0]:offs[0] + len(offs)]
+            else:
+                residuals = self.take(g)
+            dataset, scanner, dpi = parse_shard(name)
+            yield dataset, scanner, dpi, residuals, g
+
+
+def import_residual_pickle(residuals_dict, writer, dataset=None):
+    """
+    Copy a legacy residual dict into a ResidualStoreWriter. Accepts the
+    {dataset: {scanner: {dpi: [res]}}} layout of official_wiki_residuals.pkl,
+    or {scanner: [res]} (flatfield_residuals.pkl) with dataset given.
+    Legacy pickles carry no file names, so sources are recorded as
+    <shard>#<n>.
+    """
+    def add_list(ds, scanner, dpi, res_list):
+        shard = residual_shard(ds, scanner, dpi)
+        for n, res in enumerate(res_list):
+            writer.add_residual(ds, scanner, dpi, f"{shard}#{n}", np.asarray(res, dtype=np.float32))
+
+    datasets = {dataset: residuals_dict} if dataset is not None else residuals_dict
+    for ds, scanners in datasets.items():
+        for scanner, value in scanners.items():
+            if isinstance(value, dict):
+                for dpi, res_list in value.items():
+                    add_list(ds, scanner, dpi, res_list)
+            else:
+                add_list(ds, scanner, None, value)
@@ -0,0 +1,54 @@
+"""
+sources.py
+Pluggable dataset sources for the preprocessing pipeline.
+A source knows where its images live, where its outputs go and which
+`main_class` its rows carry. Register new datasets with register_source().
+"""
+
+import os
+from .engine import collect_image_tasks, IMAGE_EXTS
+
+
+class DatasetSource:
+    """
+    Default layout: <data_dir>/<scanner_id>/<subfolder>/<image>.
+    Subclass and override tasks() for other layouts; tasks must stay
+    (img_path, scanner_id, subfolder) tuples in a deterministic order.
+    """
+
+    def __init__(self, name, data_dir, output_dir, exts=IMAGE_EXTS):
+        self.name = name
+        self.data_dir = data_dir
+        self.output_dir = output_dir
+        self.exts = exts
+
+    @property
+    def csv_path(self):
+        return self.metadata_path("csv")
+
+    def metadata_path(self, fmt="csv"):
+        return os.path.join(self.output_dir, f"metadata_features.{fmt}")
+
+    def tasks(self):
+        return collect_image_tasks(self.data_dir, self.exts)
+
+    def __repr__(self):
+        return f"DatasetSource({self.name!r}, data_dir={self.data_dir!r}, output_dir={self.output_dir!r})"
+
+
+SOURCES = {}
+
+
+def register_source(source):
+    SOURCES[source.name] = source
+    return source
+
+
+def get_source(name):
+    if name not in SOURCES:
+        raise KeyError(f"Unknown dataset source: {name}. Available: {sorted(SOURCES)}")
+    return SOURCES[name]
+
+
+register_source(DatasetSource("Official", "data/Official", "processed_data/Official"))
+register_source(DatasetSource("Wikipedia", "data/Wikipedia", "processed_data/Wikipedia"))
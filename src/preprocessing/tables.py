@@ -0,0 +1,214 @@
+"""
+tables.py
+Metadata table I/O in CSV or Parquet (chosen by file extension).
+- MetadataWriter streams rows; Parquet output is written in row groups with
+  a typed schema, so floats round-trip exactly.
+- read_metadata / write_metadata wrap pandas with column projection.
+- iter_metadata / TableWriter stream DataFrame chunks for out-of-core passes.
+pyarrow is only imported when Parquet is actually used.
+"""
+
+import os
+import csv
+
+from .features import METADATA_FIELDS, ID_COLUMNS
+
+
+ROW_GROUP_SIZE = 4096
+CHUNK_ROWS = 100_000
+TABLE_EXTS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet"}
+
+
+def table_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in TABLE_EXTS:
+        raise ValueError(f"Unsupported metadata table format: {path} (use .csv or .parquet)")
+    return TABLE_EXTS[ext]
+
+
+def with_format(path, fmt):
+    """Swap the extension of path for fmt ("csv" or "parquet")."""
+    return os.path.splitext(path)[0] + "." + fmt
+
+
+def find_table(stem):
+    """
+    The most recently written of <stem>.parquet / <stem>.csv (<stem>.csv when
+    neither exists), so switching --format between runs never leaves readers
+    on a stale table of the other format.
+    """
+    found = [p for p in (stem + ".parquet", stem + ".csv") if os.path.exists(p)]
+    if not found:
+        return stem + ".csv"
+    return max(found, key=os.path.getmtime)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet metadata needs pyarrow: pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+
+def metadata_schema():
+    """Typed Arrow schema for metadata_features tables."""
+    pa, _ = _require_pyarrow()
+    fields = []
+    for name in METADATA_FIELDS:
+        if name in ID_COLUMNS:
+            fields.append(pa.field(name, pa.string()))
+        elif name in ("width", "height"):
+            fields.append(pa.field(name, pa.int32()))
+        else:
+            fields.append(pa.field(name, pa.float64()))
+    return pa.schema(fields)
+
+
+class MetadataWriter:
+    """
+    Streaming writer for metadata_features rows (dicts keyed by METADATA_FIELDS).
+    CSV rows go straight to disk; Parquet rows are buffered and flushed as one
+    row group every row_group_size rows.
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.fmt = table_format(path)
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+
+        if self.fmt == "csv":
+            self._file = open(path, "w", newline="")
+            self._csv = csv.DictWriter(self._file, fieldnames=METADATA_FIELDS)
+            self._csv.writeheader()
+        else:
+            self._pa, pq = _require_pyarrow()
+            self._schema = metadata_schema()
+            self._pq_writer = pq.ParquetWriter(path, self._schema)
+            self._buffer = []
+
+    def write_row(self, row):
+        self.rows_written += 1
+        if self.fmt == "csv":
+            self._csv.writerow(row)
+            return
+        self._buffer.append(row)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    def _flush(self):
+        if self._buffer:
+            table = self._pa.Table.from_pylist(self._buffer, schema=self._schema)
+            self._pq_writer.write_table(table)
+            self._buffer = []
+
+    def close(self):
+        if self.fmt == "csv":
+            self._file.close()
+        else:
+            self._flush()
+            self._pq_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_metadata(path, columns=None):
+    """Load a metadata table into pandas, reading only `columns` if given."""
+    import pandas as pd
+    if table_format(path) == "parquet":
+        _require_pyarrow()
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def write_metadata(df, path):
+    """Write a DataFrame as CSV or Parquet, by extension."""
+    if table_format(path) == "parquet":
+        _require_pyarrow()
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def iter_metadata(path, columns=None, chunksize=CHUNK_ROWS):
+    """Yield a metadata table as DataFrames of at most `chunksize` rows."""
+    if table_format(path) == "parquet":
+        _, pq = _require_pyarrow()
+        pf = pq.ParquetFile(path)
+        for batch in pf.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    import pandas as pd
+    yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def table_columns(path):
+    """Column names of a metadata table without reading its rows."""
+    if table_format(path) == "parquet":
+        _, pq = _require_pyarrow()
+        return list(pq.read_schema(path).names)
+    import pandas as pd
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+class TableWriter:
+    """
+    Append DataFrame chunks to one CSV / Parquet table.
+    `columns` (or else the first chunk) fixes the column order, and the first
+    chunk fixes the Parquet schema: the typed metadata_schema() for
+    metadata_features columns, inferred otherwise. Later chunks are aligned
+    and cast to it.
+    """
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.fmt = table_format(path)
+        self.rows_written = 0
+        self.columns = list(columns) if columns is not None else None
+        self._pq_writer = None
+        self._started = False
+
+    def write(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        df = df.reindex(columns=self.columns)
+
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        else:
+            pa, pq = _require_pyarrow()
+            if self._pq_writer is None:
+                if self.columns == METADATA_FIELDS:
+                    schema = metadata_schema()
+                else:
+                    schema = pa.Schema.from_pandas(df, preserve_index=False)
+                self._pq_writer = pq.ParquetWriter(self.path, schema)
+            table = pa.Table.from_pandas(df, schema=self._pq_writer.schema, preserve_index=False)
+            self._pq_writer.write_table(table)
+        self._started = True
+        self.rows_written += len(df)
+
+    def close(self):
+        if not self._started and self.columns is not None:
+            # Nothing written: still leave an empty table with the right columns
+            import pandas as pd
+            self.write(pd.DataFrame(columns=self.columns))
+        if self._pq_writer is not None:
+            self._pq_writer.close()
+            self._pq_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()